@@ -0,0 +1,262 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from db import get_conn
+from loadtest import HttpClient, InProcessClient, percentile
+
+# Latency and throughput per route, for comparing scale factors and changes.
+#
+#   python seed_data.py --scale 100                       # once per database
+#   python bench.py run --scale 100 --in-process          # Flask test client
+#   python bench.py run --scale 100 --url http://localhost:8000
+#   python bench.py compare bench-1x.json bench-100x.json
+#
+# Read routes are driven with ids sampled from the database; --writes adds
+# rent + return pairs. Results go to --out as JSON.
+
+
+class Sample:
+    # ids and search terms to spread requests over, drawn once from the database
+    def __init__(self, rng, size=1000):
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT (SELECT COUNT(*) FROM customer) AS customers,
+                       (SELECT COUNT(*) FROM inventory) AS inventory,
+                       (SELECT COUNT(*) FROM rental) AS rentals
+            """)
+            self.dataset = cur.fetchone()
+            cur.execute("SELECT film_id, title FROM film")
+            films = cur.fetchall()
+            cur.execute("SELECT actor_id FROM actor")
+            self.actor_ids = [row["actor_id"] for row in cur.fetchall()]
+            cur.execute("SELECT MIN(customer_id) AS lo, MAX(customer_id) AS hi FROM customer")
+            bounds = cur.fetchone()
+            cur.execute("SELECT DISTINCT last_name FROM customer LIMIT 200")
+            last_names = [row["last_name"] for row in cur.fetchall()]
+            # the heaviest histories are where customer details degrade first
+            cur.execute("SELECT customer_id FROM customer_rental_summary ORDER BY total_rentals DESC LIMIT 20")
+            self.heavy_customers = [row["customer_id"] for row in cur.fetchall()]
+            cur.close()
+        self.film_ids = [row["film_id"] for row in films]
+        self.words = sorted({word.lower() for row in films for word in row["title"].split()})
+        self.customer_ids = [rng.randint(bounds["lo"], bounds["hi"]) for _ in range(size)]
+        self.name_fragments = sorted({name[:3].lower() for name in last_names})
+
+
+def _customer_cursor(customer_id):
+    from server import encode_cursor
+    return encode_cursor(customer_id)
+
+
+# name -> fn(sample, rng) returning (method, path, json body)
+ROUTES = {
+    "top_films": lambda s, r: ("GET", "/api/films/top", None),
+    "top_actors": lambda s, r: ("GET", "/api/actors/top", None),
+    "film_details": lambda s, r: ("GET", f"/api/films/{r.choice(s.film_ids)}", None),
+    "films_batch": lambda s, r: ("GET", "/api/films?ids=" + ",".join(map(str, r.sample(s.film_ids, 20))), None),
+    "actor_details": lambda s, r: ("GET", f"/api/actors/{r.choice(s.actor_ids)}", None),
+    "customers_page": lambda s, r: ("GET", f"/api/customers?page={r.randint(1, 50)}&per_page=20", None),
+    "customers_by_name": lambda s, r: ("GET", f"/api/customers?last_name={r.choice(s.name_fragments)}", None),
+    "customers_keyset": lambda s, r: (
+        "GET", f"/api/customers?per_page=20&after={_customer_cursor(r.choice(s.customer_ids))}", None),
+    "customer_details": lambda s, r: ("GET", f"/api/customers/{r.choice(s.customer_ids)}/details", None),
+    "customer_details_heavy": lambda s, r: (
+        "GET", f"/api/customers/{r.choice(s.heavy_customers or s.customer_ids)}/details", None),
+    "customer_page_summary": lambda s, r: (
+        "GET", f"/api/customers/{r.choice(s.customer_ids)}/details?stats=summary&limit=20", None),
+    "search_title": lambda s, r: ("GET", f"/api/films/search?q={urllib.parse.quote(r.choice(s.words))}", None),
+    "search_all": lambda s, r: (
+        "GET", f"/api/films/search?type=all&q={urllib.parse.quote(r.choice(s.words))}", None),
+    "autocomplete": lambda s, r: ("GET", f"/api/films/autocomplete?prefix={r.choice(s.words)[:2]}", None),
+    "export_customer_rentals": lambda s, r: (
+        "GET", f"/api/export/customers/{r.choice(s.customer_ids)}/rentals", None),
+}
+
+
+def rental_body(sample, rng):
+    return {"customer_id": rng.choice(sample.customer_ids), "film_id": rng.choice(sample.film_ids)}
+
+
+def rent_and_return(client, body, record):
+    # POST /api/rentals then PUT .../return, so the stock of free copies holds steady
+    status, data = record("rent", client, "POST", "/api/rentals", body)
+    if status == 201:
+        rental_id = json.loads(data)["rental_id"]
+        record("return", client, "PUT", f"/api/rentals/{rental_id}/return", None)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = {}  # route -> {"latencies": [...], "statuses": {...}, "bytes": n}
+
+    def __call__(self, route, client, method, path, body):
+        start = time.perf_counter()
+        try:
+            status, data = client.call(method, path, body)
+        except Exception:
+            status, data = "error", b""
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            result = self.results.setdefault(route, {"latencies": [], "statuses": {}, "bytes": 0})
+            result["latencies"].append(elapsed)
+            result["statuses"][str(status)] = result["statuses"].get(str(status), 0) + 1
+            result["bytes"] += len(data)
+        return status, data
+
+
+def summarize(latencies, statuses, elapsed, nbytes):
+    latencies = sorted(latencies)
+    ms = lambda s: round(s * 1000, 2) if s is not None else None
+    errors = sum(n for status, n in statuses.items() if status == "error" or int(status) >= 500)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else None,
+        "bytes": nbytes,
+    }
+
+
+def drive(fn, concurrency, requests, duration):
+    # run fn() from `concurrency` threads until `requests` calls or `duration` seconds
+    deadline = time.monotonic() + duration if duration else None
+    remaining = [requests]
+    lock = threading.Lock()
+
+    def worker(_):
+        while True:
+            with lock:
+                if deadline is None and remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            fn()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return time.perf_counter() - start
+
+
+def run(client, routes, sample, rng, concurrency=8, requests=200, duration=0, warmup=5, writes=False, log=print):
+    rng_lock = threading.Lock()
+
+    def draw(fn):
+        with rng_lock:  # keep the request sequence reproducible from --seed
+            return fn(sample, rng)
+
+    report = {}
+    for name in routes:
+        recorder = Recorder()
+        for _ in range(warmup):
+            client.call(*draw(ROUTES[name]))
+        elapsed = drive(lambda: recorder(name, client, *draw(ROUTES[name])), concurrency, requests, duration)
+        result = recorder.results.get(name, {"latencies": [], "statuses": {}, "bytes": 0})
+        report[name] = summarize(result["latencies"], result["statuses"], elapsed, result["bytes"])
+        log(_line(name, report[name]))
+    if writes:
+        recorder = Recorder()
+        elapsed = drive(lambda: rent_and_return(client, draw(rental_body), recorder), concurrency, requests, duration)
+        for name, result in sorted(recorder.results.items()):
+            report[name] = summarize(result["latencies"], result["statuses"], elapsed, result["bytes"])
+            log(_line(name, report[name]))
+    return report
+
+
+def _line(name, r):
+    return (f"{name:<24} {r['requests']:>6} req {r['rps'] or 0:>8.1f}/s  p50={r['p50_ms']}ms "
+            f"p95={r['p95_ms']}ms p99={r['p99_ms']}ms errors={r['errors']}")
+
+
+def compare(before, after):
+    # one line per route: p50/p99 and throughput change from before to after
+    lines = [f"{'route':<24} {'p50 ms':>17} {'p99 ms':>17} {'req/s':>17} {'errors':>9}"]
+    pct = lambda a, b: f"{(b - a) / a * 100:+.0f}%" if a and b is not None else "n/a"
+    for name in sorted(set(before["routes"]) | set(after["routes"])):
+        a, b = before["routes"].get(name), after["routes"].get(name)
+        if a is None or b is None:
+            lines.append(f"{name:<24} only in {'after' if a is None else 'before'}")
+            continue
+        lines.append(
+            f"{name:<24} {a['p50_ms']!s:>6} -> {b['p50_ms']!s:<6} {pct(a['p50_ms'], b['p50_ms']):>5}"
+            f"{a['p99_ms']!s:>7} -> {b['p99_ms']!s:<6} {pct(a['p99_ms'], b['p99_ms']):>5}"
+            f"{a['rps']!s:>7} -> {b['rps']!s:<6} {pct(a['rps'], b['rps']):>5}"
+            f"{a['errors']:>4} -> {b['errors']}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every API route and compare runs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="benchmark the routes and write JSON results")
+    run_parser.add_argument("--scale", type=int, default=1, help="scale factor of the database, recorded in the results")
+    run_parser.add_argument("--url", default="http://localhost:5000", help="server to drive (ignored with --in-process)")
+    run_parser.add_argument("--in-process", action="store_true", help="call the Flask app through its test client")
+    run_parser.add_argument("--routes", default=",".join(ROUTES), help="comma separated subset of: %(default)s")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    run_parser.add_argument("--duration", type=float, default=0, help="seconds per route instead of --requests")
+    run_parser.add_argument("--warmup", type=int, default=5, help="unrecorded requests per route first")
+    run_parser.add_argument("--writes", action="store_true", help="also benchmark rent + return")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--out", help="results file (default: bench-<scale>x.json)")
+
+    compare_parser = commands.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        print(compare(before, after))
+        return
+
+    routes = [name.strip() for name in args.routes.split(",") if name.strip()]
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+
+    rng = random.Random(args.seed)
+    sample = Sample(rng)
+    client = InProcessClient() if args.in_process else HttpClient(args.url)
+    started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    report = run(client, routes, sample, rng, args.concurrency, args.requests, args.duration, args.warmup,
+                 args.writes, log=lambda line: print(line, file=sys.stderr))
+
+    results = {
+        "scale": args.scale,
+        "started_at": started,
+        "target": "in-process" if args.in_process else args.url,
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "dataset": sample.dataset,
+        "routes": report,
+    }
+    out = args.out or f"bench-{args.scale}x.json"
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+        f.write("\n")
+    print(f"results written to {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from json_provider import FastJSONProvider, orjson
+
+# Micro-benchmark: Flask's default JSON provider against FastJSONProvider
+# (stdlib and orjson backends) on real endpoint payloads.
+#
+#   python bench_json.py                  # capture payloads from the routes (needs the database)
+#   python bench_json.py --synthetic 5000 # generated rows shaped like customer history, no database
+#
+# Each payload is encoded through provider.response(), as a route would, and
+# the decoded output is checked against Flask's.
+
+CAPTURE_PATHS = [
+    "/api/films/top",
+    "/api/films?ids=" + ",".join(str(i) for i in range(1, 301)),
+    "/api/customers?per_page=100",
+    "/api/films/search?type=all&q=a",
+]
+
+
+def capture(paths, customer_id=None):
+    # run each route once and keep the object it handed to the JSON provider
+    import cache
+    from server import app
+
+    captured = {}
+
+    class Capture(DefaultJSONProvider):
+        path = None
+
+        def dumps(self, obj, **kwargs):
+            captured.setdefault(self.path, obj)  # cached_response encodes through dumps
+            return super().dumps(obj, **kwargs)
+
+        def response(self, *args, **kwargs):
+            captured[self.path] = self._prepare_response_obj(args, kwargs)
+            return super().response(*args, **kwargs)
+
+    if customer_id is not None:
+        paths = paths + [f"/api/customers/{customer_id}/details"]
+    original, app.json = app.json, Capture(app)
+    try:
+        client = app.test_client()
+        cache.invalidate(cache.TOP_FILMS, cache.TOP_ACTORS)
+        for path in paths:
+            app.json.path = path
+            status = client.get(path).status_code
+            if status != 200:
+                print(f"skipping {path}: HTTP {status}", file=sys.stderr)
+                captured.pop(path, None)
+    finally:
+        app.json = original
+    return app, captured
+
+
+def heaviest_customer():
+    from db import get_conn
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT customer_id FROM rental GROUP BY customer_id ORDER BY COUNT(*) DESC LIMIT 1")
+        row = cur.fetchone()
+        cur.close()
+    return row["customer_id"] if row else None
+
+
+def synthetic(rentals, seed=42):
+    # same field types as /api/customers/<id>/details: Decimal, datetime, None
+    rng = random.Random(seed)
+    start = datetime(2005, 5, 24, 22, 53, 30)
+    rows = []
+    for n in range(rentals):
+        rented = start + timedelta(minutes=rng.randint(0, 400000))
+        returned = rented + timedelta(days=rng.randint(1, 9)) if rng.random() > 0.02 else None
+        rows.append({
+            "rental_id": n + 1,
+            "title": f"FILM TITLE {rng.randint(1, 1000)}",
+            "rental_rate": Decimal(rng.choice(["0.99", "2.99", "4.99"])),
+            "rental_date": rented,
+            "return_date": returned,
+            "status": "Returned" if returned else "Currently Rented",
+        })
+    return {
+        "customer": {"customer_id": 1, "first_name": "MARY", "last_name": "SMITH", "email": "mary@example.org",
+                     "address_id": 5, "active": 1, "create_date": datetime(2006, 2, 14, 22, 4, 36)},
+        "rentals": rows,
+        "stats": {"total_rentals": rentals, "total_spent": Decimal("4391.18")},
+    }
+
+
+def time_response(app, provider, obj, min_seconds=0.3):
+    with app.app_context():
+        body = provider.response(obj).get_data()
+        runs, start = 0, time.perf_counter()
+        while True:
+            provider.response(obj)
+            runs += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_seconds:
+                return elapsed / runs, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON providers on endpoint payloads")
+    parser.add_argument("--synthetic", type=int, metavar="RENTALS",
+                        help="benchmark a generated customer history of this many rentals instead of live routes")
+    parser.add_argument("--seconds", type=float, default=0.3, help="minimum timing window per provider and payload")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        app, payloads = Flask(__name__), {f"synthetic customer details ({args.synthetic} rentals)": synthetic(args.synthetic)}
+    else:
+        app, payloads = capture(CAPTURE_PATHS, heaviest_customer())
+
+    providers = [("flask", DefaultJSONProvider(app)), ("fast-stdlib", FastJSONProvider(app, "stdlib"))]
+    if orjson is not None:
+        providers.append(("fast-orjson", FastJSONProvider(app, "orjson")))
+    else:
+        print("orjson is not installed, only the stdlib backend is measured", file=sys.stderr)
+
+    for name, obj in payloads.items():
+        print(name)
+        baseline = None
+        for label, provider in providers:
+            seconds, body = time_response(app, provider, obj, args.seconds)
+            same = ""
+            if baseline is None:
+                baseline = (seconds, json.loads(body))
+            elif json.loads(body) != baseline[1]:
+                same = "  OUTPUT DIFFERS"
+            print(f"    {label:<12} {seconds * 1e6:>10.0f} us  {len(body):>9} bytes  "
+                  f"{baseline[0] / seconds:>5.1f}x{same}")
+
+
+if __name__ == "__main__":
+    main()
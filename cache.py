@@ -0,0 +1,226 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from singleflight import SingleFlight
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # memory | shared
+CACHE_URL = os.getenv("CACHE_URL", "local://")  # redis://host:port/db, or local:// for the in-process stand-in
+CACHE_TTL = float(os.getenv("CACHE_TTL", 60))  # seconds
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", 1024))
+
+MISS = object()
+
+# cache keys, one place so readers and writers agree. The leaderboards hold
+# encoded JSON bodies (json_provider.cached_response), film keys hold rows.
+TOP_FILMS = "films:top:json"
+TOP_ACTORS = "actors:top:json"
+
+
+def film_key(film_id):
+    return f"film:{film_id}"
+
+
+class MemoryCache:
+    # per-process LRU with a TTL on every entry
+    def __init__(self, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISS
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISS
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class LocalRedis:
+    # in-process stand-in for the small part of the redis client API SharedCache uses
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ex or float("inf")), value)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SharedCache:
+    # cache shared by every worker through a redis-compatible client
+    def __init__(self, client, ttl=CACHE_TTL, prefix="ipbe:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception:
+            # a cache outage must not take the API down with it
+            self._count("errors")
+            raw = None
+        if raw is None:
+            self._count("misses")
+            return MISS
+        self._count("hits")
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            self.client.set(self.prefix + key, pickle.dumps(value), ex=max(1, int(ttl)))
+        except Exception:
+            self._count("errors")
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        try:
+            self.client.delete(*[self.prefix + key for key in keys])
+        except Exception:
+            self._count("errors")
+
+    def clear(self):
+        self.client.flushdb()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "shared",
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": None,  # evictions happen inside the shared server
+                "errors": self.errors,
+            }
+
+
+def make_cache(backend=CACHE_BACKEND, url=CACHE_URL):
+    if backend == "memory":
+        return MemoryCache()
+    if backend == "shared":
+        if url.startswith("local://"):
+            return SharedCache(LocalRedis())
+        import redis  # optional, only needed for a real shared backend
+        return SharedCache(redis.Redis.from_url(url))
+    raise ValueError(f"unknown CACHE_BACKEND {backend!r}")
+
+
+backend = make_cache()
+# concurrent misses on the same key share one loader call instead of all hitting MySQL
+flights = SingleFlight()
+
+
+def get_or_load(key, loader, ttl=None):
+    value = backend.get(key)
+    if value is MISS:
+        value = flights.do(key, lambda: _load(key, loader, ttl))
+    return value
+
+
+def _load(key, loader, ttl):
+    if flights.cross_process:
+        # the leader in another worker may have filled the shared cache while we waited
+        value = backend.get(key)
+        if value is not MISS:
+            return value
+    value = loader()
+    if value is not None:
+        backend.set(key, value, ttl)
+    return value
+
+
+# batch get_or_load: loader takes the missing ids and returns {id: value}
+def get_many_or_load(ids, key_fn, loader, ttl=None):
+    found = {}
+    missing = []
+    for id_ in ids:
+        value = backend.get(key_fn(id_))
+        if value is MISS:
+            missing.append(id_)
+        else:
+            found[id_] = value
+    if missing:
+        for id_, value in loader(missing).items():
+            backend.set(key_fn(id_), value, ttl)
+            found[id_] = value
+    return found
+
+
+def invalidate(*keys):
+    backend.delete(*keys)
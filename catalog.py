@@ -0,0 +1,178 @@
+import os
+import sys
+import threading
+import time
+
+from db import get_conn
+
+CATALOG_REFRESH = float(os.getenv("CATALOG_REFRESH", 600))  # seconds between background reloads, 0 disables
+
+
+class Film:
+    __slots__ = ("film_id", "title", "description", "release_year", "rating", "rental_duration",
+                 "rental_rate", "length", "replacement_cost", "categories", "actor_ids")
+
+    def __init__(self, row):
+        for field in self.__slots__[:-2]:
+            setattr(self, field, row[field])
+        self.categories = ()
+        self.actor_ids = ()
+
+    def to_dict(self):
+        # same shape get_film_details has always returned, plus the full category list
+        return {
+            "film_id": self.film_id,
+            "title": self.title,
+            "description": self.description,
+            "release_year": self.release_year,
+            "rating": self.rating,
+            "rental_duration": self.rental_duration,
+            "rental_rate": self.rental_rate,
+            "length": self.length,
+            "replacement_cost": self.replacement_cost,
+            "category_name": self.categories[0] if self.categories else None,
+            "categories": list(self.categories),
+        }
+
+
+class Actor:
+    __slots__ = ("actor_id", "first_name", "last_name", "film_ids")
+
+    def __init__(self, row):
+        self.actor_id = row["actor_id"]
+        self.first_name = row["first_name"]
+        self.last_name = row["last_name"]
+        self.film_ids = ()
+
+    @property
+    def name(self):
+        return f"{self.first_name} {self.last_name}"
+
+    def to_dict(self):
+        return {"actor_id": self.actor_id, "first_name": self.first_name, "last_name": self.last_name}
+
+
+class Snapshot:
+    # immutable once loaded; a reload builds a new Snapshot and swaps the reference
+    def __init__(self, films, actors, load_seconds):
+        self.films = films  # film_id -> Film
+        self.actors = actors  # actor_id -> Actor
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+
+    @classmethod
+    def load(cls, conn):
+        start = time.perf_counter()
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT film_id, title, description, release_year, rating, rental_duration,
+                       rental_rate, length, replacement_cost
+                FROM film
+            """)
+            films = {row["film_id"]: Film(row) for row in cur.fetchall()}
+            cur.execute("SELECT actor_id, first_name, last_name FROM actor")
+            actors = {row["actor_id"]: Actor(row) for row in cur.fetchall()}
+
+            cur.execute("""
+                SELECT fc.film_id, c.name
+                FROM film_category fc
+                JOIN category c ON fc.category_id = c.category_id
+                ORDER BY fc.film_id, c.name
+            """)
+            categories = {}
+            for row in cur.fetchall():
+                categories.setdefault(row["film_id"], []).append(row["name"])
+
+            cur.execute("SELECT film_id, actor_id FROM film_actor ORDER BY film_id, actor_id")
+            film_actors, actor_films = {}, {}
+            for row in cur.fetchall():
+                film_actors.setdefault(row["film_id"], []).append(row["actor_id"])
+                actor_films.setdefault(row["actor_id"], []).append(row["film_id"])
+        finally:
+            cur.close()
+
+        for film_id, film in films.items():
+            film.categories = tuple(categories.get(film_id, ()))
+            film.actor_ids = tuple(film_actors.get(film_id, ()))
+        for actor_id, actor in actors.items():
+            actor.film_ids = tuple(actor_films.get(actor_id, ()))
+        return cls(films, actors, time.perf_counter() - start)
+
+    def approx_bytes(self):
+        total = sys.getsizeof(self.films) + sys.getsizeof(self.actors)
+        for record in list(self.films.values()) + list(self.actors.values()):
+            total += sys.getsizeof(record)
+            for field in record.__slots__:
+                value = getattr(record, field)
+                total += sys.getsizeof(value)
+                if isinstance(value, tuple):
+                    total += sum(sys.getsizeof(v) for v in value)
+        return total
+
+    def stats(self):
+        return {
+            "films": len(self.films),
+            "actors": len(self.actors),
+            "loaded_at": self.loaded_at,
+            "load_ms": round(self.load_seconds * 1000, 1),
+            "approx_bytes": self.approx_bytes(),
+        }
+
+
+class Refresher:
+    # Holds a value built by load(). The first get() builds it inline; after
+    # that, once stale(value) is true, one background thread rebuilds it while
+    # readers keep the previous value. A failed rebuild is retried on a later get().
+    def __init__(self, load, stale):
+        self.load = load
+        self.stale = stale
+        self.value = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def reload(self):
+        value = self.load()
+        self.value = value  # readers keep whatever value they already hold
+        return value
+
+    def _refresh(self):
+        try:
+            self.reload()
+        except Exception:
+            pass  # keep serving the previous value
+        finally:
+            self._refreshing = False
+
+    def get(self):
+        if self.value is None:
+            with self._lock:
+                if self.value is None:
+                    self.reload()
+        elif not self._refreshing and self.stale(self.value):
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, daemon=True).start()
+        return self.value
+
+
+def _load():
+    with get_conn() as conn:
+        return Snapshot.load(conn)
+
+
+def _expired(snapshot):
+    return CATALOG_REFRESH and time.time() - snapshot.loaded_at > CATALOG_REFRESH
+
+
+_snapshots = Refresher(_load, _expired)
+
+
+def reload():
+    # call after writing to film, film_category, category, film_actor or actor
+    return _snapshots.reload()
+
+
+def get():
+    return _snapshots.get()
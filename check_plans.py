@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import re
+import sys
+
+import indexes
+import rollup
+from db import get_conn
+from profiler import fingerprint, normalize
+
+# Query plan regression check for CI. Runs EXPLAIN FORMAT=JSON on every
+# statement indexes.statements() finds and fails when a plan
+#
+#   - reads a GUARDED table with a full table scan, or sorts it with a filesort
+#   - gets a worse access type, switches index, or estimates more than
+#     --rows-factor times the baseline's rows for a table
+#
+# Point DB_* at a seeded database (stock Sakila or the synthetic data) and run
+#
+#   python check_plans.py --setup            # rollup tables + required indexes first
+#   python check_plans.py --update           # accept the current plans as the baseline
+#
+# Exits 1 on any regression or on a statement MySQL cannot EXPLAIN.
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plan_baseline.json")
+GUARDED = ("rental",)
+
+# best to worst, from the MySQL manual's EXPLAIN join types
+ACCESS_TYPES = ["system", "const", "eq_ref", "ref", "fulltext", "ref_or_null", "index_merge",
+                "unique_subquery", "index_subquery", "range", "index", "ALL"]
+
+
+def plan_tables(node, sorted_=False, temporary=False, out=None):
+    # flatten an EXPLAIN FORMAT=JSON document into one entry per table access
+    if out is None:
+        out = []
+    if isinstance(node, dict):
+        sorted_ = sorted_ or node.get("using_filesort") is True
+        temporary = temporary or node.get("using_temporary_table") is True
+        table = node.get("table")
+        if isinstance(table, dict) and "access_type" in table:
+            out.append({
+                "table": table.get("table_name"),
+                "access_type": table["access_type"],
+                "key": table.get("key"),
+                "rows": table.get("rows_examined_per_scan"),
+                "filesort": sorted_,
+                "temporary": temporary,
+            })
+        for value in node.values():
+            plan_tables(value, sorted_, temporary, out)
+    elif isinstance(node, list):
+        for item in node:
+            plan_tables(item, sorted_, temporary, out)
+    return out
+
+
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+`?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?", re.I)
+_NOT_ALIAS = {"WHERE", "JOIN", "LEFT", "RIGHT", "INNER", "OUTER", "CROSS", "STRAIGHT_JOIN", "ON", "USING",
+              "SET", "GROUP", "ORDER", "LIMIT", "FOR", "HAVING", "UNION", "VALUES", "WINDOW", "LOCK"}
+
+
+def aliases(sql):
+    # EXPLAIN reports tables by alias; map them back so GUARDED matches "rental r"
+    names = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        if table.upper() == "OF":
+            continue  # FOR UPDATE OF i
+        names[table] = table
+        if alias and alias.upper() not in _NOT_ALIAS:
+            names[alias] = table
+    return names
+
+
+def statement_key(where, sql):
+    # survives line moves: the function or constant plus the statement's fingerprint
+    location, scope = where.split(" ", 1)
+    return f"{location.split(':')[0]}:{scope}:{fingerprint(normalize(sql))}"
+
+
+def explain_all(conn):
+    plans, errors = {}, {}
+    cur = conn.cursor()
+    try:
+        for where, sql in indexes.statements():
+            key = statement_key(where, sql)
+            try:
+                cur.execute("EXPLAIN FORMAT=JSON " + indexes.explainable_sql(sql))
+                row = cur.fetchone()
+                doc = json.loads(row["EXPLAIN"])
+            except Exception as e:
+                errors[key] = {"where": where, "error": str(e)}
+                continue
+            tables = plan_tables(doc)
+            names = aliases(sql)
+            for t in tables:
+                t["table"] = names.get(t["table"], t["table"])
+            plans[key] = {"where": where, "sql": sql, "tables": tables}
+    finally:
+        cur.close()
+    return plans, errors
+
+
+def _rank(access_type):
+    return ACCESS_TYPES.index(access_type) if access_type in ACCESS_TYPES else len(ACCESS_TYPES)
+
+
+def regressions(plan, baseline=None, rows_factor=10):
+    problems = []
+    for t in plan["tables"]:
+        if t["table"] in GUARDED and t["access_type"] == "ALL":
+            problems.append(f"full table scan of {t['table']} (~{t['rows']} rows)")
+        if t["table"] in GUARDED and t["filesort"]:
+            problems.append(f"filesort over {t['table']} (~{t['rows']} rows)")
+    if baseline is None:
+        return problems
+
+    before = {}
+    for t in baseline["tables"]:
+        before.setdefault(t["table"], t)
+    for t in plan["tables"]:
+        old = before.get(t["table"])
+        if old is None:
+            continue
+        if _rank(t["access_type"]) > _rank(old["access_type"]):
+            problems.append(f"{t['table']}: access type {old['access_type']} -> {t['access_type']}")
+        if old["key"] and t["key"] != old["key"]:
+            problems.append(f"{t['table']}: key {old['key']} -> {t['key']}")
+        if old["rows"] and t["rows"] and t["rows"] > old["rows"] * rows_factor:
+            problems.append(f"{t['table']}: estimated rows {old['rows']} -> {t['rows']}")
+        if t["filesort"] and not old["filesort"]:
+            problems.append(f"{t['table']}: now needs a filesort")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when a SQL statement's EXPLAIN plan regresses")
+    parser.add_argument("--baseline", default=BASELINE, help="plan baseline JSON (default: %(default)s)")
+    parser.add_argument("--update", action="store_true", help="write the current plans as the new baseline")
+    parser.add_argument("--setup", action="store_true", help="rebuild the rollup tables and create missing indexes first")
+    parser.add_argument("--rows-factor", type=float, default=10, help="allowed growth in estimated rows per table")
+    args = parser.parse_args()
+
+    with get_conn() as conn:
+        if args.setup:
+            rollup.rebuild(conn)
+            indexes.migrate(conn)
+        plans, errors = explain_all(conn)
+
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump(plans, f, indent=2, sort_keys=True, default=str)
+            f.write("\n")
+        print(f"baseline written: {len(plans)} statements to {args.baseline}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    else:
+        print(f"no baseline at {args.baseline}, checking full scans and filesorts only", file=sys.stderr)
+
+    failed = 0
+    for key, plan in sorted(plans.items()):
+        problems = regressions(plan, baseline.get(key), args.rows_factor)
+        if problems:
+            failed += 1
+            print(f"FAIL {plan['where']}: {plan['sql'][:160]}")
+            for problem in problems:
+                print(f"    {problem}")
+    for key, error in sorted(errors.items()):
+        failed += 1
+        print(f"FAIL {error['where']}: EXPLAIN failed: {error['error']}")
+    for key in sorted(set(baseline) - set(plans)):
+        print(f"note: {baseline[key]['where']} is in the baseline but no longer in the code", file=sys.stderr)
+
+    print(f"{len(plans) + len(errors)} statements checked, {failed} failed", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
+import itertools
 import pymysql
 import os
+import threading
+import time
+
+from pool import ConnectionPool, PoolExhausted
 
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_USER = os.getenv("DB_USER", "root")
@@ -7,12 +12,245 @@ DB_PASS = os.getenv("DB_PASS", "aa3357")
 DB_NAME = os.getenv("DB_NAME", "sakila")
 DB_PORT = int(os.getenv("DB_PORT", 3306))
 
-def get_conn():
-    return pymysql.connect(
-        host=DB_HOST,
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 3600))  # seconds
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))  # seconds to wait for a free connection
+
+# Read replicas as host[:port], comma separated; same user, password and database as the primary
+DB_REPLICAS = [h.strip() for h in os.getenv("DB_REPLICAS", "").split(",") if h.strip()]
+DB_REPLICA_POLICY = os.getenv("DB_REPLICA_POLICY", "round_robin")  # or least_loaded
+DB_REPLICA_CHECK = float(os.getenv("DB_REPLICA_CHECK", 5))  # seconds between health checks
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 0))  # seconds behind the primary, 0 ignores lag
+DB_STICKY_SECONDS = float(os.getenv("DB_STICKY_SECONDS", 5))  # reads stay on the primary this long after a write
+
+_pool = None
+_replicas = None
+_pool_lock = threading.Lock()
+
+# Callables observer(label, sql, params, seconds, rows) run after every
+# execute/executemany; metrics.py and friends register here. label_provider,
+# if set, names the caller (e.g. the Flask endpoint) when the cursor is created.
+query_observers = []
+label_provider = None
+# prefer_primary, if set, returns True when reads must not go to a replica
+# (e.g. the client has just written and must see its own write).
+prefer_primary = None
+
+
+class ObservedCursor:
+    def __init__(self, cursor, label):
+        self._cursor = cursor
+        self.label = label
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _observe(self, sql, params, start):
+        seconds = time.perf_counter() - start
+        rows = self._cursor.rowcount
+        # unbuffered cursors do not know their row count up front
+        rows = rows if 0 <= rows < 2 ** 63 else 0
+        for observer in query_observers:
+            observer(self.label, sql, params, seconds, rows)
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, args)
+        finally:
+            self._observe(query, args, start)
+
+    def executemany(self, query, args):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            self._observe(query, args, start)
+
+
+def observe_cursor(cursor):
+    if not query_observers:
+        return cursor
+    return ObservedCursor(cursor, label_provider() if label_provider else None)
+
+
+def connect_kwargs(host=DB_HOST, port=DB_PORT):
+    return dict(
+        host=host,
         user=DB_USER,
         password=DB_PASS,
         db=DB_NAME,
-        port=DB_PORT,
+        port=port,
         cursorclass=pymysql.cursors.DictCursor
     )
+
+
+class Replica:
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = True
+        self.error = None
+        self.lag = None
+        self.reads = 0
+
+
+class ReplicaSet:
+    # Picks a healthy replica per read; returns None when every replica is
+    # down or busy so the caller can fall back to the primary.
+    POLICIES = ("round_robin", "least_loaded")
+
+    def __init__(self, replicas, policy="round_robin", check_interval=5, max_lag=0):
+        if policy not in self.POLICIES:
+            raise ValueError(f"replica policy must be one of {', '.join(self.POLICIES)}")
+        self.replicas = replicas
+        self.policy = policy
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self.fallbacks = 0
+        self._next = itertools.count()
+        self._checker = None
+
+    def _candidates(self):
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return []
+        if self.policy == "least_loaded":
+            return sorted(healthy, key=lambda r: r.pool.stats()["in_use"] / r.pool.max_size)
+        start = next(self._next) % len(healthy)
+        return healthy[start:] + healthy[:start]
+
+    def get(self):
+        for replica in self._candidates():
+            try:
+                conn = replica.pool.get()
+            except PoolExhausted:
+                continue  # busy, not broken
+            except Exception as e:
+                self._mark_down(replica, e)
+                continue
+            replica.reads += 1
+            return conn
+        self.fallbacks += 1
+        return None
+
+    def _mark_down(self, replica, error):
+        replica.healthy = False
+        replica.error = str(error)
+
+    def check(self):
+        for replica in self.replicas:
+            try:
+                with replica.pool.get() as conn:  # get() pings the connection
+                    replica.lag = self._lag(conn) if self.max_lag else None
+            except Exception as e:
+                self._mark_down(replica, e)
+                continue
+            if self.max_lag and (replica.lag is None or replica.lag > self.max_lag):
+                self._mark_down(replica, f"replication lag {replica.lag}s exceeds {self.max_lag}s")
+            else:
+                replica.healthy, replica.error = True, None
+
+    def _lag(self, conn):
+        cur = conn.cursor()
+        try:
+            try:
+                cur.execute("SHOW REPLICA STATUS")
+            except pymysql.err.ProgrammingError:
+                cur.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22
+            row = cur.fetchone()
+        finally:
+            cur.close()
+        if not row:
+            return None  # not a replica, or replication is not configured
+        # None while the SQL thread is stopped
+        return row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+
+    def _check_forever(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.check()
+            except Exception:
+                pass  # keep checking; a replica that raised stays marked down
+
+    def start(self):
+        if self._checker is None and self.check_interval:
+            self._checker = threading.Thread(target=self._check_forever, daemon=True)
+            self._checker.start()
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "fallbacks": self.fallbacks,
+            "replicas": [
+                dict(r.pool.stats(), name=r.name, healthy=r.healthy, error=r.error, lag=r.lag, reads=r.reads)
+                for r in self.replicas
+            ],
+        }
+
+
+def _parse_host(spec):
+    host, _, port = spec.partition(":")
+    return host, int(port) if port else DB_PORT
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    connect_kwargs(),
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX,
+                    max_lifetime=DB_POOL_RECYCLE,
+                    timeout=DB_POOL_TIMEOUT,
+                    cursor_wrapper=observe_cursor,
+                )
+    return _pool
+
+
+def get_replicas():
+    global _replicas
+    if _replicas is None and DB_REPLICAS:
+        with _pool_lock:
+            if _replicas is None:
+                replicas = []
+                for spec in DB_REPLICAS:
+                    host, port = _parse_host(spec)
+                    # min_size=0: a replica that is down at startup must not stop the app
+                    pool = ConnectionPool(
+                        connect_kwargs(host, port),
+                        min_size=0,
+                        max_size=DB_POOL_MAX,
+                        max_lifetime=DB_POOL_RECYCLE,
+                        timeout=DB_POOL_TIMEOUT,
+                        cursor_wrapper=observe_cursor,
+                    )
+                    replicas.append(Replica(f"{host}:{port}", pool))
+                replica_set = ReplicaSet(replicas, DB_REPLICA_POLICY, DB_REPLICA_CHECK, DB_REPLICA_MAX_LAG)
+                replica_set.start()
+                _replicas = replica_set
+    return _replicas
+
+
+def stats():
+    return {
+        "primary": get_pool().stats(),
+        "replicas": get_replicas().stats() if DB_REPLICAS else None,
+    }
+
+
+# conn.close() returns the connection to the pool; prefer `with get_conn() as conn:`.
+# read_only=True may be served by a replica; only pass it for handlers that never write.
+def get_conn(read_only=False):
+    if read_only and DB_REPLICAS and not (prefer_primary and prefer_primary()):
+        conn = get_replicas().get()
+        if conn is not None:
+            return conn
+    return get_pool().get()
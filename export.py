@@ -0,0 +1,99 @@
+import csv
+import io
+import zlib
+
+import pymysql
+from flask import Response, current_app, stream_with_context
+
+from db import get_conn
+
+FETCH_SIZE = 1000  # rows pulled off the server-side cursor per chunk
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+CUSTOMERS_SQL = """
+    SELECT customer_id, store_id, first_name, last_name, email, address_id, active, create_date
+    FROM customer
+    ORDER BY customer_id
+"""
+
+RENTALS_SQL = """
+    SELECT rental_id, rental_date, inventory_id, customer_id, return_date, staff_id
+    FROM rental
+    ORDER BY rental_id
+"""
+
+CUSTOMER_RENTALS_SQL = """
+    SELECT r.rental_id, i.film_id, f.title, f.rental_rate, r.rental_date, r.return_date
+    FROM rental r
+    JOIN inventory i ON r.inventory_id = i.inventory_id
+    JOIN film f ON i.film_id = f.film_id
+    WHERE r.customer_id = %s
+    ORDER BY r.rental_date DESC, r.rental_id DESC
+"""
+
+
+def read_chunks(conn, sql, params=None, size=FETCH_SIZE):
+    # unbuffered cursor: at most size rows are held in memory at a time
+    cur = conn.cursor(pymysql.cursors.SSDictCursor)
+    try:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+def csv_lines(chunks):
+    buf = io.StringIO()
+    writer = None
+    for rows in chunks:
+        if writer is None:
+            writer = csv.DictWriter(buf, fieldnames=list(rows[0]))
+            writer.writeheader()
+        writer.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def ndjson_lines(chunks, dumps):
+    for rows in chunks:
+        yield "".join(dumps(row) + "\n" for row in rows)
+
+
+def gzipped(parts):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for part in parts:
+        data = compressor.compress(part.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_query(sql, params=None, fmt="ndjson", gzip=False, filename="export"):
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    dumps = current_app.json.dumps
+    conn = get_conn(read_only=True)
+
+    def generate():
+        try:
+            chunks = read_chunks(conn, sql, params)
+            lines = csv_lines(chunks) if fmt == "csv" else ndjson_lines(chunks, dumps)
+            yield from (gzipped(lines) if gzip else lines)
+        finally:
+            conn.close()
+
+    # the generator runs after the view returns; keep the request context so
+    # the export query is still attributed to its endpoint
+    response = Response(stream_with_context(generate()), mimetype=FORMATS[fmt])
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    if gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    # releases the connection even if the body is never iterated
+    response.call_on_close(conn.close)
+    return response
@@ -0,0 +1,204 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+
+from db import get_conn
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+# Only %s placeholders in VALUES, so pymysql's executemany rewrites each chunk
+# into one multi-row INSERT (NOW() in VALUES would make it fall back to one
+# statement per row); create_date is passed as a parameter instead.
+INSERT_SQL = """
+    INSERT INTO customer (store_id, first_name, last_name, email, address_id, active, create_date)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+# sakila column widths
+LIMITS = {"first_name": 45, "last_name": 45, "email": 50}
+# accepted spellings of the active flag (strings are lower-cased first); blank means active
+ACTIVE_VALUES = {1: 1, 0: 0, "1": 1, "0": 0, "true": 1, "false": 0, "yes": 1, "no": 0}
+
+
+def read_json_array(stream):
+    rows = json.load(stream)
+    if not isinstance(rows, list):
+        raise ValueError("expected a JSON array of customers")
+    return iter(rows)
+
+
+def read_ndjson(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield {"__error__": f"invalid JSON: {e}"}
+
+
+def read_csv(stream):
+    return csv.DictReader(stream)
+
+
+READERS = {"json": read_json_array, "ndjson": read_ndjson, "csv": read_csv}
+
+
+def validate(row):
+    # (store_id, first_name, last_name, email, address_id, active) or raise ValueError
+    if not isinstance(row, dict):
+        raise ValueError("row must be an object")
+    if "__error__" in row:
+        raise ValueError(row["__error__"])
+    values = {}
+    for field in ("first_name", "last_name", "email"):
+        value = row.get(field)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"{field} must be a string")
+        value = value.strip() if value is not None else value
+        if field != "email" and not value:
+            raise ValueError(f"{field} is required")
+        if value and len(value) > LIMITS[field]:
+            raise ValueError(f"{field} is longer than {LIMITS[field]} characters")
+        values[field] = value or None
+    if values["email"] and "@" not in values["email"]:
+        raise ValueError("email is not valid")
+    try:
+        store_id = int(row.get("store_id") or 1)
+        address_id = int(row.get("address_id") or 1)
+    except (TypeError, ValueError):
+        raise ValueError("store_id and address_id must be integers")
+    active = row.get("active")
+    if isinstance(active, str):
+        active = active.strip().lower()
+    if active in (None, ""):
+        active = 1
+    elif isinstance(active, (int, str)) and active in ACTIVE_VALUES:
+        active = ACTIVE_VALUES[active]
+    else:
+        raise ValueError("active must be 1/0, true/false or yes/no")
+    return (store_id, values["first_name"], values["last_name"], values["email"], address_id, active)
+
+
+class Importer:
+    def __init__(self, conn, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.conn = conn
+        self.chunk_size = chunk_size
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self._known = {"store": set(), "address": set()}
+
+    def error(self, row_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
+
+    def _existing(self, cur, table, ids):
+        # foreign keys are checked once per chunk with one IN query, and remembered
+        known = self._known[table]
+        missing = [i for i in set(ids) if i not in known]
+        if missing:
+            cur.execute(f"SELECT {table}_id AS id FROM {table} WHERE {table}_id IN ({', '.join(['%s'] * len(missing))})",
+                        missing)
+            known.update(row["id"] for row in cur.fetchall())
+        return known
+
+    def run(self, rows):
+        rows = enumerate(rows, start=1)
+        cur = self.conn.cursor()
+        try:
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                self._import_chunk(cur, chunk)
+        finally:
+            cur.close()
+        return self.report()
+
+    def _import_chunk(self, cur, chunk):
+        valid = []
+        for row_number, row in chunk:
+            try:
+                valid.append((row_number, validate(row)))
+            except ValueError as e:
+                self.error(row_number, str(e))
+        if not valid:
+            return
+
+        stores = self._existing(cur, "store", [v[0] for _, v in valid])
+        addresses = self._existing(cur, "address", [v[4] for _, v in valid])
+        checked = []
+        for row_number, values in valid:
+            if values[0] not in stores:
+                self.error(row_number, f"store_id {values[0]} does not exist")
+            elif values[4] not in addresses:
+                self.error(row_number, f"address_id {values[4]} does not exist")
+            else:
+                checked.append((row_number, values))
+
+        now = datetime.now()
+        try:
+            cur.executemany(INSERT_SQL, [values + (now,) for _, values in checked])
+            self.conn.commit()
+            self.inserted += len(checked)
+        except Exception:
+            # something in the chunk was rejected, retry row by row to report which one
+            self.conn.rollback()
+            for row_number, values in checked:
+                try:
+                    cur.execute(INSERT_SQL, values + (now,))
+                    self.inserted += 1
+                except Exception as e:
+                    self.error(row_number, str(e))
+            self.conn.commit()
+
+    def report(self):
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def import_customers(stream, fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    rows = READERS[fmt](stream)
+    with get_conn() as conn:
+        return Importer(conn, chunk_size).run(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import customers from JSON, NDJSON or CSV")
+    parser.add_argument("path", help="file to import, - for stdin")
+    parser.add_argument("--format", choices=sorted(READERS), help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per INSERT and commit")
+    args = parser.parse_args()
+
+    fmt = args.format or args.path.rsplit(".", 1)[-1].lower()
+    if fmt not in READERS:
+        parser.error("cannot tell the format from the file name, pass --format")
+
+    stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8") if args.path == "-" else open(args.path, encoding="utf-8", newline="")
+    start = time.perf_counter()
+    with stream:
+        report = import_customers(stream, fmt, args.chunk_size)
+    elapsed = time.perf_counter() - start
+
+    for error in report["errors"]:
+        print(f"row {error['row']}: {error['error']}", file=sys.stderr)
+    total = report["inserted"] + report["failed"]
+    print(f"imported {report['inserted']} customers, {report['failed']} failed, "
+          f"{elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/s)")
+    sys.exit(1 if report["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import ast
+import json
+import os
+import re
+import sys
+
+from db import get_conn
+
+# Indexes the hot paths rely on, checked against information_schema and
+# created online when missing. Stock Sakila covers some of them; schema
+# variants and hand-built test databases often do not.
+#
+#   python indexes.py check               # list missing indexes
+#   python indexes.py migrate [--dry-run] # create them (ALGORITHM=INPLACE, LOCK=NONE)
+#   python indexes.py explain             # EXPLAIN every SQL statement the routes run
+
+INDEX_CHECK = os.getenv("INDEX_CHECK", "warn")  # at startup: off, warn or create
+
+# (table, columns, name used when creating it, who needs it). An existing index
+# whose leading columns match counts, whatever it is called.
+REQUIRED = [
+    ("rental", ("customer_id", "rental_date"), "idx_rental_customer_date",
+     "customer details history, customer rental export (WHERE customer_id ORDER BY rental_date)"),
+    ("rental", ("inventory_id", "return_date"), "idx_rental_inventory_return",
+     "rentals: open-rental checks in inventory.allocate and rebuild_availability"),
+    ("inventory", ("film_id",), "idx_inventory_film",
+     "rentals and availability: copies of a film"),
+    ("film_actor", ("film_id",), "idx_film_actor_film",
+     "rollup.record_rentals: actors of the rented films"),
+    ("film_rental_count", ("rentals",), "idx_film_rental_count_rentals", "top films leaderboard"),
+    ("actor_rental_count", ("rentals",), "idx_actor_rental_count_rentals", "top actors leaderboard, actor details"),
+]
+
+# Modules whose SQL the routes execute, relative to this file
+SOURCES = ("server.py", "inventory.py", "rollup.py", "export.py")
+
+# Handlers that assemble their SQL piece by piece: the scanner skips them and
+# explains these representative shapes instead
+DYNAMIC = {
+    # the name filters are substring matches (LIKE '%x%'), which no B-tree
+    # index can serve, so the first shape is expected to scan customer
+    ("server.py", "get_customers"): [
+        "SELECT customer_id, first_name, last_name, email FROM customer WHERE 1=1 "
+        "AND first_name LIKE '%mar%' AND last_name LIKE '%ann%' LIMIT %s OFFSET %s",
+        "SELECT customer_id, first_name, last_name, email FROM customer WHERE 1=1 "
+        "AND customer_id > %s ORDER BY customer_id LIMIT %s",
+    ],
+}
+
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+# Functions and constants that read whole tables on purpose (batch rebuilds, full exports)
+FULL_SCANS = {"rebuild", "rebuild_availability", "CUSTOMERS_SQL", "RENTALS_SQL"}
+
+
+def existing(cur):
+    # table -> list of (index name, column tuple) in the current database
+    cur.execute("""
+        SELECT TABLE_NAME AS table_name, INDEX_NAME AS index_name, COLUMN_NAME AS column_name
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+        ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+    """)
+    indexes = {}
+    for row in cur.fetchall():
+        indexes.setdefault(row["table_name"], {}).setdefault(row["index_name"], []).append(row["column_name"])
+    return {table: [(name, tuple(cols)) for name, cols in found.items()] for table, found in indexes.items()}
+
+
+def tables(cur):
+    cur.execute("SELECT TABLE_NAME AS table_name FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()")
+    return {row["table_name"] for row in cur.fetchall()}
+
+
+def missing(cur):
+    # requirements with no index starting with their columns; tables that do
+    # not exist yet (e.g. before `rollup.py rebuild`) are skipped
+    present = tables(cur)
+    indexes = existing(cur)
+    out = []
+    for table, columns, name, reason in REQUIRED:
+        if table not in present:
+            continue
+        if not any(cols[:len(columns)] == columns for _, cols in indexes.get(table, ())):
+            out.append((table, columns, name, reason))
+    return out
+
+
+def create_sql(table, columns, name):
+    # online DDL: reads and writes continue while InnoDB builds the index
+    return f"ALTER TABLE `{table}` ADD INDEX `{name}` ({', '.join(f'`{c}`' for c in columns)}), ALGORITHM=INPLACE, LOCK=NONE"
+
+
+def migrate(conn, dry_run=False):
+    cur = conn.cursor()
+    try:
+        todo = missing(cur)
+        for table, columns, name, _ in todo:
+            if not dry_run:
+                cur.execute(create_sql(table, columns, name))
+        return todo
+    finally:
+        cur.close()
+
+
+def ensure(mode=INDEX_CHECK):
+    # startup hook: warn about or create missing indexes
+    if mode == "off":
+        return []
+    if mode not in ("warn", "create"):
+        raise ValueError("INDEX_CHECK must be off, warn or create")
+    with get_conn() as conn:
+        todo = migrate(conn, dry_run=mode == "warn")
+    for table, columns, name, reason in todo:
+        action = "created" if mode == "create" else "missing"
+        print(f"index {action}: {table}({', '.join(columns)}) for {reason}", file=sys.stderr)
+    return todo
+
+
+_SLOT = re.compile(r"\{\w*\}")
+
+
+def _render_slots(text):
+    # "{}"/"{name}" after "(" is a placeholder list, anywhere else an optional clause
+    return _SLOT.sub(lambda m: "%s" if text[:m.start()].rstrip().endswith("(") else "", text)
+
+
+def _literal(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        return "".join(v.value if isinstance(v, ast.Constant) else "{}" for v in node.values)
+    return None
+
+
+def _first_word(sql):
+    return sql.lstrip(" \n\t(").split(None, 1)[0].upper() if sql.strip() else ""
+
+
+def _scope(stmt):
+    if isinstance(stmt, (ast.FunctionDef, ast.ClassDef)):
+        return stmt.name
+    if isinstance(stmt, ast.Assign) and isinstance(stmt.targets[0], ast.Name):
+        return stmt.targets[0].id
+    return "<module>"
+
+
+def statements(sources=SOURCES):
+    # (where, sql) for every SQL string literal in the given modules, labelled
+    # by the top-level function or constant it belongs to
+    base = os.path.dirname(os.path.abspath(__file__))
+    found = []
+    for filename in sources:
+        with open(os.path.join(base, filename)) as f:
+            tree = ast.parse(f.read(), filename)
+        for stmt in tree.body:
+            scope = _scope(stmt)
+            if scope in FULL_SCANS:
+                continue
+            if (filename, scope) in DYNAMIC:
+                found.extend((f"{filename}:{stmt.lineno} {scope}", sql) for sql in DYNAMIC[(filename, scope)])
+                continue
+            parts = set()  # string pieces of an f-string are not statements on their own
+            for node in ast.walk(stmt):
+                if isinstance(node, ast.JoinedStr):
+                    parts.update(id(v) for v in node.values)
+                text = _literal(node)
+                if text is None or id(node) in parts or len(text.split()) < 2 or _first_word(text) not in EXPLAINABLE:
+                    continue
+                sql = " ".join(_render_slots(text).split())
+                found.append((f"{filename}:{node.lineno} {scope}", sql))
+    return found
+
+
+def explainable_sql(sql):
+    # sample literals so EXPLAIN can plan the statement without real parameters
+    sql = re.sub(r"LIMIT\s+%s\s+OFFSET\s+%s", "LIMIT 10 OFFSET 0", sql, flags=re.I)
+    sql = re.sub(r"LIMIT\s+%s", "LIMIT 10", sql, flags=re.I)
+    return sql.replace("%s", "'1'")
+
+
+def explain(cur, sql):
+    cur.execute("EXPLAIN " + explainable_sql(sql))
+    return cur.fetchall()
+
+
+def findings(plan, min_rows=1000):
+    # full table scans, full index scans and filesorts over at least min_rows estimated rows
+    out = []
+    for row in plan:
+        rows = row.get("rows") or 0
+        if rows < min_rows:
+            continue
+        extra = row.get("Extra") or ""
+        if row.get("type") == "ALL":
+            out.append(f"full table scan of {row.get('table')} (~{rows} rows)")
+        elif row.get("type") == "index":
+            out.append(f"full index scan of {row.get('table')} via {row.get('key')} (~{rows} rows)")
+        if "Using filesort" in extra:
+            out.append(f"filesort over {row.get('table')} (~{rows} rows)")
+    return out
+
+
+def report(conn, min_rows=1000):
+    cur = conn.cursor()
+    results = []
+    try:
+        for where, sql in statements():
+            try:
+                plan = explain(cur, sql)
+            except Exception as e:
+                results.append({"where": where, "sql": sql, "error": str(e), "findings": []})
+                continue
+            results.append({"where": where, "sql": sql, "findings": findings(plan, min_rows), "plan": plan})
+    finally:
+        cur.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check, create and audit the indexes the API relies on")
+    parser.add_argument("command", choices=["check", "migrate", "explain"])
+    parser.add_argument("--dry-run", action="store_true", help="migrate: print the DDL without running it")
+    parser.add_argument("--min-rows", type=int, default=1000, help="explain: ignore scans estimated below this")
+    parser.add_argument("--json", action="store_true", help="explain: print the full report as JSON")
+    args = parser.parse_args()
+
+    with get_conn() as conn:
+        if args.command == "explain":
+            results = report(conn, args.min_rows)
+            if args.json:
+                json.dump(results, sys.stdout, indent=2, default=str)
+                print()
+            for result in results:
+                if args.json or not (result["findings"] or result.get("error")):
+                    continue
+                print(f"{result['where']}: {result['sql'][:160]}")
+                for finding in result["findings"]:
+                    print(f"    {finding}")
+                if result.get("error"):
+                    print(f"    EXPLAIN failed: {result['error']}")
+            flagged = sum(1 for r in results if r["findings"])
+            print(f"{len(results)} statements explained, {flagged} flagged", file=sys.stderr)
+            sys.exit(1 if flagged else 0)
+
+        todo = migrate(conn, dry_run=args.command == "check" or args.dry_run)
+    for table, columns, name, reason in todo:
+        if args.command == "check":
+            print(f"missing: {table}({', '.join(columns)}) - {reason}")
+        else:
+            print(create_sql(table, columns, name) + (";" if args.dry_run else "  -- done"))
+    if not todo:
+        print("all required indexes present")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import sys
+
+MAX_ALLOCATION_ATTEMPTS = 5
+
+# Free copies per film and store, so "can this be rented" is a primary key
+# lookup instead of an inventory/rental anti-join. Kept in step by
+# record_checkout()/record_return() inside the rental transactions and
+# backfilled by rebuild_availability() (python rollup.py rebuild).
+AVAILABILITY_TABLE = """
+    CREATE TABLE IF NOT EXISTS film_availability (
+        film_id SMALLINT UNSIGNED NOT NULL,
+        store_id TINYINT UNSIGNED NOT NULL,
+        available_copies INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (film_id, store_id)
+    )
+"""
+
+
+def allocate(cur, film_id, exclude=()):
+    # Lock one free copy of the film for this transaction and return its
+    # inventory_id, or None when every copy is out.
+    #
+    # SKIP LOCKED lets concurrent checkouts of the same film each lock a
+    # different copy instead of queueing on (or double-booking) the first one.
+    # The NOT EXISTS probe reads the transaction snapshot, which can predate a
+    # rental another checkout just committed on the row we locked, so the copy
+    # is confirmed with a locking (current) read before it is handed out.
+    # Every allocator holds the inventory row lock until commit, so no two
+    # transactions can insert an open rental for the same copy.
+    #
+    # exclude lists copies this transaction already holds (our own locks are
+    # not skipped), e.g. when one basket rents two copies of a film.
+    skipped = list(exclude)
+    for _ in range(MAX_ALLOCATION_ATTEMPTS):
+        not_in = ""
+        if skipped:
+            not_in = "AND i.inventory_id NOT IN ({})".format(", ".join(["%s"] * len(skipped)))
+        cur.execute(f"""
+            SELECT i.inventory_id
+            FROM inventory i
+            WHERE i.film_id = %s {not_in}
+              AND NOT EXISTS (
+                  SELECT 1 FROM rental r
+                  WHERE r.inventory_id = i.inventory_id AND r.return_date IS NULL
+              )
+            LIMIT 1
+            FOR UPDATE OF i SKIP LOCKED
+        """, [film_id] + skipped)
+        row = cur.fetchone()
+        if not row:
+            return None
+        inventory_id = row['inventory_id']
+
+        cur.execute("""
+            SELECT rental_id FROM rental
+            WHERE inventory_id = %s AND return_date IS NULL
+            LIMIT 1
+            FOR UPDATE
+        """, (inventory_id,))
+        if not cur.fetchone():
+            return inventory_id
+        skipped.append(inventory_id)
+    return None
+
+
+# Availability rows are always updated one by one in (film_id, store_id)
+# order, so checkouts, baskets and returns lock them in the same order.
+def _adjust(cur, changes):
+    for row in changes:
+        cur.execute("""
+            UPDATE film_availability SET available_copies = available_copies + %s
+            WHERE film_id = %s AND store_id = %s
+        """, (row['delta'], row['film_id'], row['store_id']))
+        if cur.rowcount == 0:
+            _recount(cur, row['film_id'], row['store_id'])
+
+
+def _recount(cur, film_id, store_id):
+    # no counter row to adjust (table not backfilled, or a copy stocked after
+    # the rebuild): count this film and store from the source tables instead,
+    # which already include this transaction's own rental change
+    print(f"film_availability had no row for film {film_id} store {store_id}, recounted; "
+          "run `python rollup.py rebuild` if this repeats", file=sys.stderr)
+    cur.execute("""
+        INSERT INTO film_availability (film_id, store_id, available_copies)
+        SELECT %s, %s, COUNT(*)
+        FROM inventory i
+        WHERE i.film_id = %s AND i.store_id = %s
+          AND NOT EXISTS (
+              SELECT 1 FROM rental r
+              WHERE r.inventory_id = i.inventory_id AND r.return_date IS NULL
+          )
+        ON DUPLICATE KEY UPDATE available_copies = VALUES(available_copies)
+    """, (film_id, store_id, film_id, store_id))
+
+
+def record_checkout(cur, inventory_id):
+    record_checkouts(cur, [inventory_id])
+
+
+def record_checkouts(cur, inventory_ids):
+    cur.execute("""
+        SELECT film_id, store_id, -COUNT(*) AS delta
+        FROM inventory
+        WHERE inventory_id IN ({})
+        GROUP BY film_id, store_id
+        ORDER BY film_id, store_id
+    """.format(", ".join(["%s"] * len(inventory_ids))), list(inventory_ids))
+    _adjust(cur, cur.fetchall())
+
+
+# call in the same transaction as the UPDATE that set return_date, only for rentals it changed
+def record_return(cur, rental_id):
+    record_returns(cur, [rental_id])
+
+
+def record_returns(cur, rental_ids):
+    cur.execute("""
+        SELECT i.film_id, i.store_id, COUNT(*) AS delta
+        FROM rental r
+        JOIN inventory i ON r.inventory_id = i.inventory_id
+        WHERE r.rental_id IN ({})
+        GROUP BY i.film_id, i.store_id
+        ORDER BY i.film_id, i.store_id
+    """.format(", ".join(["%s"] * len(rental_ids))), list(rental_ids))
+    _adjust(cur, cur.fetchall())
+
+
+def available_copies(cur, film_ids):
+    # film_id -> free copies across all stores, None when the film has no
+    # counter rows yet (not backfilled), the same "unknown" rent_film assumes
+    if not film_ids:
+        return {}
+    cur.execute("""
+        SELECT film_id, SUM(available_copies) AS available_copies
+        FROM film_availability
+        WHERE film_id IN ({})
+        GROUP BY film_id
+    """.format(", ".join(["%s"] * len(film_ids))), list(film_ids))
+    found = {row['film_id']: int(row['available_copies']) for row in cur.fetchall()}
+    return {film_id: found.get(film_id) for film_id in film_ids}
+
+
+# expects the table to exist already (rollup.ensure_tables), since DDL would commit the caller's transaction
+def rebuild_availability(cur):
+    cur.execute("DELETE FROM film_availability")
+    # every film and store gets a row, 0 when it stocks no copies, so a
+    # missing row only ever means "not backfilled"
+    cur.execute("""
+        INSERT INTO film_availability (film_id, store_id, available_copies)
+        SELECT f.film_id, s.store_id,
+               COUNT(CASE WHEN i.inventory_id IS NOT NULL AND NOT EXISTS (
+                   SELECT 1 FROM rental r
+                   WHERE r.inventory_id = i.inventory_id AND r.return_date IS NULL
+               ) THEN 1 END)
+        FROM film f
+        CROSS JOIN store s
+        LEFT JOIN inventory i ON i.film_id = f.film_id AND i.store_id = s.store_id
+        GROUP BY f.film_id, s.store_id
+    """)
+    return cur.rowcount
@@ -0,0 +1,148 @@
+import dataclasses
+import decimal
+import json
+import os
+import uuid
+from datetime import date, datetime, timezone
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+import cache
+
+try:
+    import orjson  # optional; without it the stdlib encoder is used
+except ImportError:
+    orjson = None
+
+# JSON for every response, export line and cached body.
+#
+# JSON_PROVIDER: auto (orjson when installed, else stdlib), orjson, stdlib, or
+#                flask to keep Flask's own provider.
+# JSON_DATETIME: http (RFC 822, what Flask has always sent) or iso (ISO 8601,
+#                cheaper with orjson). Decimals are always sent as strings,
+#                e.g. "4.99", so no precision is lost.
+JSON_PROVIDER = os.getenv("JSON_PROVIDER", "auto")
+JSON_DATETIME = os.getenv("JSON_DATETIME", "http")
+
+
+_DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = (None, "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def http_date(o):
+    # same text as werkzeug.http.http_date (naive values are taken as UTC),
+    # without the timetuple round trip that made it most of the encoding time
+    if isinstance(o, datetime):
+        if o.tzinfo is not None:
+            o = o.astimezone(timezone.utc)
+        clock = f"{o.hour:02d}:{o.minute:02d}:{o.second:02d}"
+    else:
+        clock = "00:00:00"
+    return f"{_DAYS[o.weekday()]}, {o.day:02d} {_MONTHS[o.month]} {o.year:04d} {clock} GMT"
+
+
+def _default_http(o):
+    if isinstance(o, date):
+        return http_date(o)
+    return _default_common(o)
+
+
+def _default_iso(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    return _default_common(o)
+
+
+def _default_common(o):
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # Same output as Flask's DefaultJSONProvider (sorted keys, compact unless
+    # debug), produced by orjson or one reused stdlib encoder. orjson writes
+    # non-ASCII as UTF-8 instead of \u escapes; the decoded JSON is identical.
+    def __init__(self, app, backend="orjson", datetime_format="http"):
+        super().__init__(app)
+        if backend == "orjson" and orjson is None:
+            raise RuntimeError("JSON_PROVIDER=orjson needs the orjson package")
+        self.backend = backend
+        self.default = _default_iso if datetime_format == "iso" else _default_http
+        if backend == "orjson":
+            self._options = orjson.OPT_NON_STR_KEYS
+            if datetime_format == "http":
+                self._options |= orjson.OPT_PASSTHROUGH_DATETIME  # hand dates to default()
+        self._encoders = {}  # indent -> json.JSONEncoder, built once per shape
+
+    def _encoder(self, indent=None):
+        encoder = self._encoders.get(indent)
+        if encoder is None:
+            encoder = self._encoders[indent] = json.JSONEncoder(
+                default=self.default, ensure_ascii=self.ensure_ascii, sort_keys=self.sort_keys,
+                indent=indent, separators=(",", ": ") if indent else (",", ":"),
+            )
+        return encoder
+
+    def dumps_bytes(self, obj, indent=False):
+        if self.backend == "orjson":
+            options = self._options
+            if self.sort_keys:
+                options |= orjson.OPT_SORT_KEYS
+            if indent:
+                options |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=self.default, option=options)
+        return self._encoder(2 if indent else None).encode(obj).encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # unusual arguments: fall back to json.dumps with the same defaults
+            kwargs.setdefault("default", self.default)
+            return super().dumps(obj, **kwargs)
+        if self.backend == "orjson":
+            return self.dumps_bytes(obj).decode()
+        return self._encoder().encode(obj)
+
+    def loads(self, s, **kwargs):
+        if self.backend == "orjson" and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def _indent(self):
+        return (self.compact is None and self._app.debug) or self.compact is False
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj, self._indent()) + b"\n", mimetype=self.mimetype)
+
+
+def encode(obj):
+    # bytes for obj with the app's provider, whichever one is installed
+    provider = current_app.json
+    if isinstance(provider, FastJSONProvider):
+        return provider.dumps_bytes(obj)
+    return provider.dumps(obj, separators=(",", ":")).encode()
+
+
+def cached_response(key, loader, ttl=None):
+    # caches the encoded body rather than the rows, so a hit skips serialization;
+    # keys used here must only ever hold bytes
+    body = cache.get_or_load(key, lambda: encode(loader()), ttl)
+    return current_app.response_class(body + b"\n", mimetype=current_app.json.mimetype)
+
+
+def init_app(app, provider=JSON_PROVIDER, datetime_format=JSON_DATETIME):
+    if provider == "flask":
+        return
+    if provider == "auto":
+        provider = "orjson" if orjson is not None else "stdlib"
+    if provider not in ("orjson", "stdlib"):
+        raise ValueError("JSON_PROVIDER must be auto, orjson, stdlib or flask")
+    if datetime_format not in ("http", "iso"):
+        raise ValueError("JSON_DATETIME must be http or iso")
+    app.json = FastJSONProvider(app, provider, datetime_format)
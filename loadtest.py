@@ -0,0 +1,58 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+# Clients and latency helpers shared by stress_rentals.py, bench.py and
+# replay.py (percentile is also used by profiler.py).
+#
+# Both clients send JSON bodies. call() returns (status, raw body bytes);
+# call_json() decodes the body (None if it is not JSON).
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class Client:
+    def call(self, method, path, body=None):
+        raise NotImplementedError
+
+    def call_json(self, method, path, body=None):
+        status, data = self.call(method, path, body)
+        try:
+            return status, json.loads(data or b"null")
+        except ValueError:
+            return status, None  # e.g. an HTML error page; callers go by the status
+
+
+class HttpClient(Client):
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def call(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class InProcessClient(Client):
+    # Flask test client against server.app, one per thread
+    def __init__(self):
+        from server import app
+        self.app = app
+        self.local = threading.local()
+
+    def call(self, method, path, body=None):
+        if not hasattr(self.local, "client"):
+            self.local.client = self.app.test_client()
+        resp = self.local.client.open(path, method=method, json=body)
+        return resp.status_code, resp.get_data()  # drains streamed bodies too
@@ -0,0 +1,183 @@
+import bisect
+import os
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+
+import cache
+import db
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _labels(self.labelnames, k), v) for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[i] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        out = []
+        for labels, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = _labels(self.labelnames + ("le",), labels + (bound,))
+                out.append((self.name + "_bucket", le, cumulative))
+            out.append((self.name + "_sum", _labels(self.labelnames, labels), counts[-1]))
+            out.append((self.name + "_count", _labels(self.labelnames, labels), cumulative))
+        return out
+
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+RESPONSE_BYTES = Counter("http_response_bytes_total", "Response body bytes (non-streamed responses)", ("route",))
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled right now")
+DB_TIME = Histogram("db_query_duration_seconds", "Time spent in cursor.execute by caller", ("label",))
+DB_ROWS = Counter("db_rows_total", "Rows returned or affected by caller", ("label",))
+
+METRICS = [REQUESTS, LATENCY, RESPONSE_BYTES, IN_FLIGHT, DB_TIME, DB_ROWS]
+
+
+def _route():
+    # the URL rule, not the path, so /api/films/1 and /api/films/2 share a series
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def _query_label():
+    if not has_request_context():
+        return "background"
+    return request.endpoint or "unmatched"
+
+
+def _observe_query(label, sql, params, seconds, rows):
+    label = (label or "background",)
+    DB_TIME.observe(label, seconds)
+    DB_ROWS.inc(label, rows)
+
+
+def _before():
+    g.metrics_start = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+def _after(response):
+    route = _route()
+    start = g.get("metrics_start")
+    if start is not None:
+        LATENCY.observe((request.method, route), time.perf_counter() - start)
+    REQUESTS.inc((request.method, route, str(response.status_code)))
+    if not response.is_streamed and response.content_length is not None:
+        RESPONSE_BYTES.inc((route,), response.content_length)
+    return response
+
+
+def _teardown(exc):
+    if g.pop("metrics_start", None) is not None:
+        IN_FLIGHT.dec()
+
+
+def _runtime_samples():
+    # read at scrape time instead of being pushed on every request
+    out = []
+    pool = db._pool
+    if pool is not None:
+        for key, value in pool.stats().items():
+            out.append(("db_pool_" + key, "", value))
+    replicas = db._replicas
+    if replicas is not None:
+        out.append(("db_replica_fallbacks", "", replicas.fallbacks))
+        for replica in replicas.replicas:
+            labels = _labels(("replica",), (replica.name,))
+            out.append(("db_replica_healthy", labels, int(replica.healthy)))
+            out.append(("db_replica_reads", labels, replica.reads))
+            for key in ("in_use", "idle", "timeouts"):
+                out.append(("db_replica_pool_" + key, labels, replica.pool.stats()[key]))
+    for key, value in cache.backend.stats().items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            out.append(("cache_" + key, "", value))
+    for key, value in cache.flights.stats().items():
+        if isinstance(value, int) and not isinstance(value, bool):
+            out.append(("singleflight_" + key, "", value))
+    return out
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+    typed = set()
+    for name, labels, value in _runtime_samples():
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    if not METRICS_ENABLED:
+        return
+    app.before_request(_before)
+    app.after_request(_after)
+    app.teardown_request(_teardown)
+    db.query_observers.append(_observe_query)
+    db.label_provider = _query_label
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import deque
+
+import pymysql
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class PooledConnection:
+    # thin wrapper around a pymysql connection, close() hands it back to the pool
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise pymysql.err.InterfaceError("connection already returned to the pool")
+        return getattr(self._raw, name)
+
+    def cursor(self, *args):
+        cur = self.__getattr__("cursor")(*args)
+        wrapper = self._pool.cursor_wrapper
+        return wrapper(cur) if wrapper is not None else cur
+
+    def close(self):
+        if self._raw is None:
+            return
+        raw, self._raw = self._raw, None
+        self._pool._release(raw, self._created_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._raw is not None:
+            try:
+                self._raw.rollback()
+            except Exception:
+                pass
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    def __init__(self, connect_kwargs, min_size=1, max_size=10, max_lifetime=3600, timeout=5.0,
+                 cursor_wrapper=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self.connect_kwargs = dict(connect_kwargs)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.cursor_wrapper = cursor_wrapper  # called with every new cursor, may return a proxy
+
+        self._idle = deque()  # (raw connection, created_at)
+        self._size = 0  # idle + checked out
+        self._cond = threading.Condition()
+        self.checkouts = 0
+        self.timeouts = 0
+
+        for _ in range(min_size):
+            self._idle.append(self._connect())
+            self._size += 1
+
+    def _connect(self):
+        return pymysql.connect(**self.connect_kwargs), time.monotonic()
+
+    def _expired(self, created_at):
+        return self.max_lifetime and time.monotonic() - created_at > self.max_lifetime
+
+    def _healthy(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def get(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    self.checkouts += 1
+                    break
+                if self._size < self.max_size:
+                    # reserve the slot before connecting outside the lock
+                    self._size += 1
+                    self.checkouts += 1
+                    raw = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolExhausted(
+                        f"no database connection available after {self.timeout}s "
+                        f"(pool max_size={self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+        try:
+            if raw is not None and (self._expired(created_at) or not self._healthy(raw)):
+                self._discard(raw)
+                raw = None
+            if raw is None:
+                raw, created_at = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw, created_at)
+
+    def _release(self, raw, created_at):
+        keep = raw.open and not self._expired(created_at)
+        if keep:
+            try:
+                # never hand out a connection with a half-finished transaction
+                raw.rollback()
+            except Exception:
+                keep = False
+        with self._cond:
+            if keep:
+                self._idle.append((raw, created_at))
+            else:
+                self._size -= 1
+            self._cond.notify()
+        if not keep:
+            self._discard(raw)
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                raw, _ = self._idle.pop()
+                self._size -= 1
+                self._discard(raw)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+            }
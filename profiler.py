@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+from flask import has_request_context, jsonify, request
+
+import db
+from loadtest import percentile
+
+# Per-statement profiling. Every execute() is reduced to a fingerprint (the SQL
+# with literals and placeholders replaced by "?") and aggregated; statements
+# slower than SLOW_QUERY_MS are appended to the slow log with their EXPLAIN.
+#
+#   python profiler.py report slow_queries.log   # top offenders from a slow log
+
+QUERY_PROFILE = os.getenv("QUERY_PROFILE", "0") not in ("0", "false")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG")  # NDJSON file; unset keeps only the in-memory tail
+PROFILE_SAMPLES = 1024  # latencies kept per fingerprint for p50/p99
+SLOW_TAIL = 100
+EXPLAIN_INTERVAL = 60  # seconds before the same fingerprint is explained again
+
+_COMMENT = re.compile(r"/\*.*?\*/|--[^\n]*", re.S)
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+# a parenthesized tuple (one level of nested calls such as NOW() allowed)
+# followed by identical copies of itself, as in a multi-row VALUES list
+_VALUES_LIST = re.compile(r"(\((?:[^()]|\([^()]*\))*\))(?:\s*,\s*\1)+")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(sql):
+    sql = _COMMENT.sub(" ", sql)
+    sql = _STRING.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    # IN (?, ?, ?) and repeated VALUES tuples collapse so batch sizes share a fingerprint
+    sql = _IN_LIST.sub("(?+)", sql)
+    sql = _VALUES_LIST.sub(r"\1", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+class QueryStats:
+    __slots__ = ("sql", "labels", "count", "total", "max", "rows", "samples")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.labels = set()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples = deque(maxlen=PROFILE_SAMPLES)
+
+    def add(self, label, seconds, rows):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.rows += rows
+        self.samples.append(seconds)
+        if label:
+            self.labels.add(label)
+
+    def to_dict(self, fp):
+        samples = sorted(self.samples)
+        ms = lambda s: round(s * 1000, 2) if s is not None else None
+        return {
+            "fingerprint": fp,
+            "sql": self.sql,
+            "endpoints": sorted(self.labels),
+            "count": self.count,
+            "total_ms": ms(self.total),
+            "mean_ms": ms(self.total / self.count),
+            "p50_ms": ms(percentile(samples, 50)),
+            "p99_ms": ms(percentile(samples, 99)),
+            "max_ms": ms(self.max),
+            "rows": self.rows,
+            "rows_per_call": round(self.rows / self.count, 1),
+        }
+
+
+class Profiler:
+    SORT_KEYS = ("total_ms", "p99_ms", "p50_ms", "count", "rows", "max_ms")
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, slow_log=SLOW_QUERY_LOG):
+        self.slow_seconds = slow_ms / 1000
+        self.slow_log = slow_log
+        self.slow_tail = deque(maxlen=SLOW_TAIL)
+        self._stats = {}  # fingerprint -> QueryStats
+        self._explained = {}  # fingerprint -> monotonic time of the last EXPLAIN
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def observe(self, label, sql, params, seconds, rows):
+        if getattr(self._local, "explaining", False):
+            return  # our own EXPLAIN statements
+        normalized = normalize(sql)
+        fp = fingerprint(normalized)
+        with self._lock:
+            stats = self._stats.get(fp)
+            if stats is None:
+                stats = self._stats[fp] = QueryStats(normalized)
+            stats.add(label, seconds, rows)
+        if seconds >= self.slow_seconds:
+            self._slow(fp, label, sql, params, seconds, rows)
+
+    def _slow(self, fp, label, sql, params, seconds, rows):
+        entry = {
+            "ts": round(time.time(), 3),
+            "fingerprint": fp,
+            "endpoint": label,
+            "ms": round(seconds * 1000, 2),
+            "rows": rows,
+            "sql": _SPACE.sub(" ", sql).strip(),
+            "params": repr(params)[:500],
+        }
+        now = time.monotonic()
+        with self._lock:
+            due = now - self._explained.get(fp, float("-inf")) >= EXPLAIN_INTERVAL
+            if due:
+                self._explained[fp] = now
+        if due and _explainable(sql, params):
+            # off the request thread: the caller already paid for the slow query
+            threading.Thread(target=self._explain_and_log, args=(entry, sql, params), daemon=True).start()
+        else:
+            self._log(entry)
+
+    def _explain_and_log(self, entry, sql, params):
+        self._local.explaining = True
+        try:
+            with db.get_conn() as conn:
+                cur = conn.cursor()
+                try:
+                    cur.execute("EXPLAIN " + sql, params)
+                    entry["explain"] = cur.fetchall()
+                finally:
+                    cur.close()
+        except Exception as e:
+            entry["explain_error"] = str(e)
+        finally:
+            self._local.explaining = False
+        self._log(entry)
+
+    def _log(self, entry):
+        self.slow_tail.append(entry)
+        if self.slow_log:
+            line = json.dumps(entry, default=str) + "\n"
+            with self._lock:
+                with open(self.slow_log, "a") as f:
+                    f.write(line)
+
+    def top(self, sort="total_ms", limit=20):
+        with self._lock:
+            items = [stats.to_dict(fp) for fp, stats in self._stats.items()]
+        items.sort(key=lambda item: item[sort] or 0, reverse=True)
+        return items[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._explained.clear()
+        self.slow_tail.clear()
+
+
+def _explainable(sql, params):
+    # executemany batches and DDL cannot be explained as-is
+    if isinstance(params, list) and params and isinstance(params[0], (list, tuple, dict)):
+        return False
+    return normalize(sql).split(" ", 1)[0].upper() in ("SELECT", "UPDATE", "DELETE", "INSERT", "REPLACE")
+
+
+profiler = Profiler()
+
+
+def init_app(app):
+    if not QUERY_PROFILE:
+        return
+    db.query_observers.append(profiler.observe)
+    if db.label_provider is None:
+        # metrics.init_app normally sets this; fall back to the Flask endpoint
+        db.label_provider = lambda: request.endpoint if has_request_context() else None
+
+    @app.route("/api/debug/queries", methods=["GET"])
+    def debug_queries():
+        sort = request.args.get("sort", "total_ms")
+        if sort not in Profiler.SORT_KEYS:
+            return jsonify({"error": f"sort must be one of: {', '.join(Profiler.SORT_KEYS)}"}), 400
+        limit = min(max(int(request.args.get("limit", 20)), 1), 500)
+        return jsonify({
+            "slow_query_ms": profiler.slow_seconds * 1000,
+            "queries": profiler.top(sort, limit),
+            "slow": list(profiler.slow_tail)[-limit:],
+        })
+
+    @app.route("/api/debug/queries", methods=["DELETE"])
+    def reset_queries():
+        profiler.reset()
+        return jsonify({"message": "Query profile reset"})
+
+
+def report(lines, sort="total_ms", limit=20):
+    # aggregate a slow log the same way the live profiler does
+    offline = Profiler(slow_ms=float("inf"), slow_log=None)
+    plans = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        entry = json.loads(line)
+        offline.observe(entry.get("endpoint"), entry["sql"], None, entry["ms"] / 1000, entry.get("rows", 0))
+        if entry.get("explain"):
+            plans[entry["fingerprint"]] = entry["explain"]
+    top = offline.top(sort, limit)
+    for item in top:
+        item["explain"] = plans.get(item["fingerprint"])
+    return top
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise a slow query log written by the profiler")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("path", nargs="?", default=SLOW_QUERY_LOG, help="slow log (default: $SLOW_QUERY_LOG)")
+    parser.add_argument("--sort", choices=Profiler.SORT_KEYS, default="total_ms")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args()
+    if not args.path:
+        parser.error("no slow log given and SLOW_QUERY_LOG is not set")
+
+    with open(args.path) as f:
+        top = report(f, args.sort, args.limit)
+    if args.json:
+        json.dump(top, sys.stdout, indent=2, default=str)
+        print()
+        return
+    for item in top:
+        print(f"{item['fingerprint']}  n={item['count']}  total={item['total_ms']}ms  "
+              f"p50={item['p50_ms']}ms  p99={item['p99_ms']}ms  rows/call={item['rows_per_call']}  "
+              f"[{', '.join(item['endpoints'])}]")
+        print(f"    {item['sql'][:200]}")
+        for row in item["explain"] or ():
+            print(f"    explain: table={row.get('table')} type={row.get('type')} key={row.get('key')} "
+                  f"rows={row.get('rows')} extra={row.get('Extra')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import argparse
+import json
+import queue
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+from bench import compare, summarize
+from loadtest import percentile
+
+# Replays traffic recorded by traffic.py against a local instance.
+#
+#   python replay.py run requests.jsonl --url http://localhost:5000 --rate 2 --workers 16 --out run-a.json
+#   python replay.py summarize requests.jsonl --out recorded.json   # the recording's own latencies
+#   python replay.py compare recorded.json run-a.json
+#
+# Requests are issued at their recorded offsets divided by --rate (2 = twice
+# as fast); --rate 0 sends them back to back. Results use bench.py's format,
+# grouped by method and path with numeric segments folded to {id}.
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def route_key(method, path):
+    return f"{method} {_ID_SEGMENT.sub('/{id}', path)}"
+
+
+def read_recording(lines):
+    entries = [json.loads(line) for line in lines if line.strip()]
+    entries.sort(key=lambda e: e["ts"])
+    return entries
+
+
+class RawHttpClient:
+    # sends the recorded body and content type untouched
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def call(self, entry):
+        url = self.base_url + entry["path"] + ("?" + entry["query"] if entry.get("query") else "")
+        data = entry["body"].encode() if entry.get("body") is not None else None
+        headers = {"Content-Type": entry["content_type"]} if entry.get("content_type") else {}
+        req = urllib.request.Request(url, data=data, method=entry["method"], headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return resp.status, len(resp.read())
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+
+
+def replay(entries, client, rate=1.0, workers=8, log=print):
+    # a dispatcher releases requests on the recorded schedule; workers send them
+    results = {}  # route -> {"latencies", "statuses", "bytes"}
+    lag = []  # seconds each request left later than scheduled, i.e. workers were saturated
+    mismatched = [0]
+    lock = threading.Lock()
+    work = queue.Queue(maxsize=workers * 4)
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            due, entry = item
+            started = time.perf_counter()
+            try:
+                status, nbytes = client.call(entry)
+            except Exception:
+                status, nbytes = "error", 0
+            elapsed = time.perf_counter() - started
+            with lock:
+                lag.append(max(0.0, started - due))
+                result = results.setdefault(route_key(entry["method"], entry["path"]),
+                                            {"latencies": [], "statuses": {}, "bytes": 0})
+                result["latencies"].append(elapsed)
+                result["statuses"][str(status)] = result["statuses"].get(str(status), 0) + 1
+                result["bytes"] += nbytes
+                if status != entry.get("status"):
+                    mismatched[0] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    t0 = entries[0]["ts"] if entries else 0
+    for n, entry in enumerate(entries, 1):
+        due = start + ((entry["ts"] - t0) / rate if rate else 0)
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        work.put((due if rate else time.perf_counter(), entry))
+        if n % 1000 == 0:
+            log(f"{n}/{len(entries)} requests sent")
+    for _ in threads:
+        work.put(None)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    routes = {key: summarize(r["latencies"], r["statuses"], elapsed, r["bytes"]) for key, r in sorted(results.items())}
+    lag.sort()
+    return {
+        "routes": routes,
+        "requests": len(entries),
+        "elapsed_s": round(elapsed, 3),
+        "status_mismatches": mismatched[0],
+        "schedule_lag_p99_ms": round(percentile(lag, 99) * 1000, 2) if lag else None,
+    }
+
+
+def summarize_recording(entries):
+    # the recording's own latencies in the same shape, to compare a replay against production
+    grouped = {}
+    for entry in entries:
+        result = grouped.setdefault(route_key(entry["method"], entry["path"]), {"latencies": [], "statuses": {}, "bytes": 0})
+        result["latencies"].append(entry["latency_ms"] / 1000)
+        status = str(entry["status"])
+        result["statuses"][status] = result["statuses"].get(status, 0) + 1
+        result["bytes"] += entry.get("bytes") or 0
+    span = entries[-1]["ts"] - entries[0]["ts"] if len(entries) > 1 else 0
+    return {
+        "routes": {key: summarize(r["latencies"], r["statuses"], span, r["bytes"]) for key, r in sorted(grouped.items())},
+        "requests": len(entries),
+        "elapsed_s": round(span, 3),
+    }
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+        f.write("\n")
+    print(f"results written to {path}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded traffic and compare runs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="replay a recording against a server")
+    run_parser.add_argument("recording")
+    run_parser.add_argument("--url", default="http://localhost:5000")
+    run_parser.add_argument("--rate", type=float, default=1.0, help="speed-up over the recorded rate, 0 = as fast as possible")
+    run_parser.add_argument("--workers", type=int, default=8, help="concurrent requests in flight")
+    run_parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    run_parser.add_argument("--out", default="replay.json")
+
+    summarize_parser = commands.add_parser("summarize", help="latency summary of the recording itself")
+    summarize_parser.add_argument("recording")
+    summarize_parser.add_argument("--out", default="recorded.json")
+
+    compare_parser = commands.add_parser("compare", help="compare two run or summarize results")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        before, after = _load(args.before), _load(args.after)
+        print(compare(before, after))
+        for label, results in (("before", before), ("after", after)):
+            if "status_mismatches" in results:
+                print(f"{label}: {results['status_mismatches']} of {results['requests']} responses differ "
+                      f"from the recorded status, schedule lag p99 {results['schedule_lag_p99_ms']}ms")
+        return
+
+    with open(args.recording) as f:
+        entries = read_recording(f)
+    if args.command == "summarize":
+        _write(args.out, summarize_recording(entries))
+        return
+
+    if args.limit:
+        entries = entries[:args.limit]
+    if args.rate < 0:
+        parser.error("--rate must be >= 0")
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    results = replay(entries, RawHttpClient(args.url), args.rate, args.workers,
+                     log=lambda line: print(line, file=sys.stderr))
+    results.update(
+        recording=args.recording, target=args.url, rate=args.rate, workers=args.workers,
+        started_at=started_at,
+    )
+    _write(args.out, results)
+
+
+if __name__ == "__main__":
+    main()
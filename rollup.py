@@ -0,0 +1,199 @@
+import argparse
+import os
+import sys
+
+from db import get_conn
+import inventory
+
+ROLLUP_CHECK = os.getenv("ROLLUP_CHECK", "warn")  # at startup: off, warn or rebuild
+
+# Per-film, per-actor and per-customer rental rollups, kept in step with the
+# rental table by record_rental()/record_return() so hot endpoints never have
+# to aggregate rental history.
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS film_rental_count (
+        film_id SMALLINT UNSIGNED NOT NULL PRIMARY KEY,
+        rentals INT UNSIGNED NOT NULL DEFAULT 0,
+        KEY idx_film_rental_count_rentals (rentals)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS actor_rental_count (
+        actor_id SMALLINT UNSIGNED NOT NULL PRIMARY KEY,
+        rentals INT UNSIGNED NOT NULL DEFAULT 0,
+        KEY idx_actor_rental_count_rentals (rentals)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS customer_rental_summary (
+        customer_id INT UNSIGNED NOT NULL PRIMARY KEY,
+        total_rentals INT NOT NULL DEFAULT 0,
+        current_rentals INT NOT NULL DEFAULT 0,
+        total_spent DECIMAL(10,2) NOT NULL DEFAULT 0
+    )
+    """,
+]
+
+
+def ensure_tables(cur):
+    for ddl in TABLES + [inventory.AVAILABILITY_TABLE]:
+        cur.execute(ddl)
+
+
+# call inside the same transaction as the rental INSERT, before commit
+def record_rental(cur, film_id, customer_id, count=1):
+    record_rentals(cur, customer_id, {film_id: count})
+
+
+# film_id -> copies rented by one customer. One statement per table, rows
+# taken in primary key order, so single and basket checkouts lock them in the
+# same order (films that share actors would otherwise deadlock).
+def record_rentals(cur, customer_id, per_film):
+    film_ids = sorted(per_film)
+    cur.execute("""
+        INSERT INTO film_rental_count (film_id, rentals)
+        VALUES {}
+        ON DUPLICATE KEY UPDATE rentals = rentals + VALUES(rentals)
+    """.format(", ".join(["(%s, %s)"] * len(film_ids))),
+        [value for film_id in film_ids for value in (film_id, per_film[film_id])])
+    cur.execute("""
+        INSERT INTO actor_rental_count (actor_id, rentals)
+        SELECT actor_id, SUM(CASE film_id {} END) FROM film_actor
+        WHERE film_id IN ({})
+        GROUP BY actor_id
+        ORDER BY actor_id
+        ON DUPLICATE KEY UPDATE rentals = rentals + VALUES(rentals)
+    """.format(" ".join(["WHEN %s THEN %s"] * len(film_ids)), ", ".join(["%s"] * len(film_ids))),
+        [value for film_id in film_ids for value in (film_id, per_film[film_id])] + film_ids)
+    count = sum(per_film.values())
+    cur.execute("""
+        INSERT INTO customer_rental_summary (customer_id, total_rentals, current_rentals)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            total_rentals = total_rentals + VALUES(total_rentals),
+            current_rentals = current_rentals + VALUES(current_rentals)
+    """, (customer_id, count, count))
+
+
+# call in the same transaction as the UPDATE that set return_date, only for rentals it changed
+def record_return(cur, rental_id):
+    record_returns(cur, [rental_id])
+
+
+def record_returns(cur, rental_ids):
+    cur.execute("""
+        UPDATE customer_rental_summary s
+        JOIN (
+            SELECT r.customer_id, COUNT(*) AS returned, SUM(f.rental_rate) AS spent
+            FROM rental r
+            JOIN inventory i ON r.inventory_id = i.inventory_id
+            JOIN film f ON i.film_id = f.film_id
+            WHERE r.rental_id IN ({})
+            GROUP BY r.customer_id
+        ) x ON x.customer_id = s.customer_id
+        SET s.current_rentals = s.current_rentals - x.returned,
+            s.total_spent = s.total_spent + x.spent
+    """.format(", ".join(["%s"] * len(rental_ids))), list(rental_ids))
+
+
+def rebuild(conn):
+    cur = conn.cursor()
+    try:
+        ensure_tables(cur)
+        # DELETE rather than TRUNCATE so the swap happens in one transaction
+        cur.execute("DELETE FROM film_rental_count")
+        cur.execute("""
+            INSERT INTO film_rental_count (film_id, rentals)
+            SELECT i.film_id, COUNT(*)
+            FROM rental r
+            JOIN inventory i ON r.inventory_id = i.inventory_id
+            GROUP BY i.film_id
+        """)
+        films = cur.rowcount
+        cur.execute("DELETE FROM actor_rental_count")
+        cur.execute("""
+            INSERT INTO actor_rental_count (actor_id, rentals)
+            SELECT fa.actor_id, SUM(frc.rentals)
+            FROM film_actor fa
+            JOIN film_rental_count frc ON fa.film_id = frc.film_id
+            GROUP BY fa.actor_id
+        """)
+        actors = cur.rowcount
+        cur.execute("DELETE FROM customer_rental_summary")
+        cur.execute("""
+            INSERT INTO customer_rental_summary (customer_id, total_rentals, current_rentals, total_spent)
+            SELECT r.customer_id,
+                   COUNT(*),
+                   COUNT(CASE WHEN r.return_date IS NULL THEN 1 END),
+                   COALESCE(SUM(CASE WHEN r.return_date IS NOT NULL THEN f.rental_rate ELSE 0 END), 0)
+            FROM rental r
+            JOIN inventory i ON r.inventory_id = i.inventory_id
+            JOIN film f ON i.film_id = f.film_id
+            GROUP BY r.customer_id
+        """)
+        customers = cur.rowcount
+        availability = inventory.rebuild_availability(cur)
+        conn.commit()
+        return {"films": films, "actors": actors, "customers": customers, "availability": availability}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def needs_rebuild(cur):
+    # tables that are empty although their source tables are not
+    cur.execute("""
+        SELECT EXISTS(SELECT 1 FROM rental) AS rental,
+               EXISTS(SELECT 1 FROM film_rental_count) AS film_rental_count,
+               EXISTS(SELECT 1 FROM customer_rental_summary) AS customer_rental_summary,
+               EXISTS(SELECT 1 FROM inventory) AS inventory,
+               EXISTS(SELECT 1 FROM film_availability) AS film_availability
+    """)
+    row = cur.fetchone()
+    empty = []
+    if row["rental"]:
+        empty += [t for t in ("film_rental_count", "customer_rental_summary") if not row[t]]
+    if row["inventory"] and not row["film_availability"]:
+        empty.append("film_availability")
+    return empty
+
+
+def ensure(mode=ROLLUP_CHECK):
+    # startup hook: create missing tables, then warn about or backfill empty ones
+    if mode == "off":
+        return []
+    if mode not in ("warn", "rebuild"):
+        raise ValueError("ROLLUP_CHECK must be off, warn or rebuild")
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            ensure_tables(cur)
+            empty = needs_rebuild(cur)
+        finally:
+            cur.close()
+        if empty and mode == "rebuild":
+            counts = rebuild(conn)
+            print(f"rollup rebuilt at startup: {counts}", file=sys.stderr)
+        elif empty:
+            print(f"WARNING: {', '.join(empty)} empty while rental/inventory have rows; leaderboards, "
+                  "customer summaries and availability are wrong until `python rollup.py rebuild` "
+                  "(or start with ROLLUP_CHECK=rebuild)", file=sys.stderr)
+    return empty
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the rental rollup and availability tables")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: create the tables and backfill them from rental and inventory")
+    parser.parse_args()
+
+    with get_conn() as conn:
+        counts = rebuild(conn)
+    print(f"rollup rebuilt: {counts['films']} films, {counts['actors']} actors, {counts['customers']} customers, "
+          f"{counts['availability']} film/store availability rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import defaultdict
+
+from db import get_conn
+import catalog
+
+FIELDS = ("title", "actor", "genre")
+# how much a match in each field counts towards the score in "all" mode
+FIELD_WEIGHTS = {"title": 3, "actor": 2, "genre": 1}
+EXACT_BONUS = 1  # a whole-word match outranks a prefix match
+
+_token_re = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return _token_re.findall(text.lower()) if text else []
+
+
+class SearchIndex:
+    # inverted index over film titles, actor names and category names
+    def __init__(self):
+        self.titles = {}  # film_id -> title
+        self.postings = {field: defaultdict(set) for field in FIELDS}  # field -> token -> {film_id}
+        self.film_tokens = {}  # film_id -> {field: {token}}, so a film can be replaced or removed
+        self._sorted = {field: [] for field in FIELDS}  # sorted vocabulary per field, for prefix lookups
+        self._dirty = set(FIELDS)
+        self._lock = threading.RLock()
+        self.built_at = None
+
+    @classmethod
+    def build(cls, snapshot):
+        index = cls()
+        for film in snapshot.films.values():
+            actors = [snapshot.actors[a].name for a in film.actor_ids if a in snapshot.actors]
+            index.add_film(film.film_id, film.title, actors, film.categories)
+        index.built_at = time.time()
+        return index
+
+    def add_film(self, film_id, title, actors=(), genres=()):
+        fields = {
+            "title": set(tokenize(title)),
+            "actor": {t for name in actors for t in tokenize(name)},
+            "genre": {t for name in genres for t in tokenize(name)},
+        }
+        with self._lock:
+            self._remove(film_id)
+            self.titles[film_id] = title
+            self.film_tokens[film_id] = fields
+            for field, tokens in fields.items():
+                postings = self.postings[field]
+                for token in tokens:
+                    if token not in postings:
+                        self._dirty.add(field)
+                    postings[token].add(film_id)
+
+    def remove_film(self, film_id):
+        with self._lock:
+            self._remove(film_id)
+
+    def _remove(self, film_id):
+        fields = self.film_tokens.pop(film_id, None)
+        if fields is None:
+            return
+        self.titles.pop(film_id, None)
+        for field, tokens in fields.items():
+            postings = self.postings[field]
+            for token in tokens:
+                films = postings.get(token)
+                if films is None:
+                    continue
+                films.discard(film_id)
+                if not films:
+                    del postings[token]
+                    self._dirty.add(field)
+
+    def _vocabulary(self, field):
+        if field in self._dirty:
+            self._sorted[field] = sorted(self.postings[field])
+            self._dirty.discard(field)
+        return self._sorted[field]
+
+    def _match(self, field, token):
+        # film_id -> score for one query token as a prefix of any indexed token
+        vocabulary = self._vocabulary(field)
+        postings = self.postings[field]
+        scores = {}
+        i = bisect.bisect_left(vocabulary, token)
+        while i < len(vocabulary) and vocabulary[i].startswith(token):
+            word = vocabulary[i]
+            score = 1 + (EXACT_BONUS if word == token else 0)
+            for film_id in postings[word]:
+                if scores.get(film_id, 0) < score:
+                    scores[film_id] = score
+            i += 1
+        return scores
+
+    def search(self, query, field="title", limit=50):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        fields = FIELDS if field == "all" else (field,)
+        with self._lock:
+            total = None
+            # every query token has to match somewhere in the searched fields
+            for token in tokens:
+                token_scores = {}
+                for f in fields:
+                    weight = FIELD_WEIGHTS[f] if field == "all" else 1
+                    for film_id, score in self._match(f, token).items():
+                        token_scores[film_id] = max(token_scores.get(film_id, 0), score * weight)
+                if total is None:
+                    total = token_scores
+                else:
+                    total = {film_id: total[film_id] + s for film_id, s in token_scores.items() if film_id in total}
+                if not total:
+                    return []
+            ranked = sorted(total.items(), key=lambda item: (-item[1], self.titles[item[0]]))
+            return [{"film_id": film_id, "title": self.titles[film_id]} for film_id, _ in ranked[:limit]]
+
+
+class AutocompleteIndex:
+    # sorted parallel arrays of lowercased keys, one key per word start of each
+    # title or actor name, so "gui" finds "PENELOPE GUINESS" too. Never changed
+    # after build(); new films and renames arrive with the next catalog snapshot.
+    def __init__(self):
+        self.keys = []
+        self.refs = []  # refs[i] is the (kind, id) entry keys[i] points at
+        self.labels = {}  # (kind, id) -> display label
+        self.rentals = {}  # (kind, id) -> rental count, used for ranking
+
+    @classmethod
+    def build(cls, conn, snapshot):
+        # names come from the catalog snapshot, only the rental counts from MySQL
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT film_id, rentals FROM film_rental_count")
+            film_rentals = {row["film_id"]: row["rentals"] for row in cur.fetchall()}
+            cur.execute("SELECT actor_id, rentals FROM actor_rental_count")
+            actor_rentals = {row["actor_id"]: row["rentals"] for row in cur.fetchall()}
+        finally:
+            cur.close()
+
+        index = cls()
+        pairs = []
+        entries = [(("film", f.film_id), f.title, film_rentals) for f in snapshot.films.values()]
+        entries += [(("actor", a.actor_id), a.name, actor_rentals) for a in snapshot.actors.values()]
+        for ref, label, rentals in entries:
+            index.labels[ref] = label
+            index.rentals[ref] = int(rentals.get(ref[1], 0))
+            pairs.extend((key, ref) for key in cls._keys(label))
+        pairs.sort()
+        index.keys = [key for key, _ in pairs]
+        index.refs = [ref for _, ref in pairs]
+        return index
+
+    @staticmethod
+    def _keys(label):
+        words = label.lower().split()
+        return [" ".join(words[i:]) for i in range(len(words))]
+
+    def complete(self, prefix, limit=10):
+        prefix = " ".join(prefix.lower().split())
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\uffff", start)
+        matches = set(self.refs[start:end])
+        best = heapq.nsmallest(limit, matches, key=lambda ref: (-self.rentals[ref], self.labels[ref]))
+        return [
+            {"type": kind, "id": ref_id, "label": self.labels[(kind, ref_id)], "rentals": self.rentals[(kind, ref_id)]}
+            for kind, ref_id in best
+        ]
+
+
+class Indexes:
+    __slots__ = ("snapshot_loaded_at", "search", "autocomplete")
+
+    def __init__(self, snapshot_loaded_at, search, autocomplete):
+        self.snapshot_loaded_at = snapshot_loaded_at
+        self.search = search
+        self.autocomplete = autocomplete
+
+
+def _build():
+    snapshot = catalog.get()
+    index = SearchIndex.build(snapshot)
+    with get_conn() as conn:
+        autocomplete = AutocompleteIndex.build(conn, snapshot)
+    return Indexes(snapshot.loaded_at, index, autocomplete)
+
+
+def _outdated(indexes):
+    # rebuilt whenever catalog swaps in a new snapshot, not on a timer of their own
+    return catalog.get().loaded_at != indexes.snapshot_loaded_at
+
+
+_indexes = catalog.Refresher(_build, _outdated)
+
+
+def reload():
+    return _indexes.reload().search
+
+
+def get_index():
+    return _indexes.get().search
+
+
+def get_autocomplete():
+    return _indexes.get().autocomplete
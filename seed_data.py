@@ -0,0 +1,300 @@
+import argparse
+import random
+import re
+import sys
+import time
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+import pymysql
+
+import rollup
+from db import get_conn
+from import_customers import INSERT_SQL as CUSTOMER_INSERT_SQL
+
+# Deterministic synthetic data on top of a stock Sakila database: grows
+# customer, inventory and rental to --scale times their current size.
+#
+#   python seed_data.py --scale 100 [--seed 42]
+#
+# Skew follows what real rental data looks like: film popularity and customer
+# activity are Zipf-distributed, popular films stock more copies, and every
+# copy has a non-overlapping rental history ending in at most one open rental.
+# New rentals only go to new copies, so the original data is left as it was.
+# Run it once on a fresh copy of Sakila; it finishes with `rollup.py rebuild`.
+#
+# Stock Sakila's customer_create_date and rental_date triggers overwrite the
+# generated dates with NOW(), so they are dropped for the load and recreated
+# afterwards. That needs the TRIGGER privilege on customer and rental (and,
+# with binary logging on, SUPER or log_bin_trust_function_creators); the
+# script checks this up front and refuses to run without it.
+
+SCALES = (10, 100, 1000)
+BATCH = 5000
+# same window as the stock rentals
+START = datetime(2005, 5, 24, 22, 0, 0)
+END = datetime(2006, 2, 14, 15, 16, 3)
+OPEN_RATE = 0.012  # share of copies whose last rental is still out, as in stock Sakila
+FILM_SKEW = 1.0  # Zipf exponent for film popularity
+CUSTOMER_SKEW = 0.6  # Zipf exponent for customer activity
+EMAIL_DOMAIN = "synthetic.sakilacustomer.org"
+DATE_TRIGGERS = ("customer_create_date", "rental_date")  # BEFORE INSERT ... SET NEW.<date> = NOW()
+_DEFINER = re.compile(r"\s+DEFINER\s*=\s*\S+?@\S+(?=\s)", re.I)
+
+INVENTORY_INSERT_SQL = "INSERT INTO inventory (film_id, store_id) VALUES (%s, %s)"
+RENTAL_INSERT_SQL = """
+    INSERT INTO rental (rental_date, inventory_id, customer_id, return_date, staff_id)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+
+def zipf_weights(n, skew, rng):
+    # popularity by rank, ranks shuffled so ids carry no signal
+    ranks = list(range(1, n + 1))
+    rng.shuffle(ranks)
+    return [1 / rank ** skew for rank in ranks]
+
+
+class Chooser:
+    # weighted choice for large populations: one cumulative table, bisect per draw
+    def __init__(self, items, weights, rng):
+        self.items = items
+        self.cumulative = list(accumulate(weights))
+        self.rng = rng
+
+    def __call__(self):
+        return self.items[bisect(self.cumulative, self.rng.random() * self.cumulative[-1])]
+
+
+def _column(cur, sql):
+    cur.execute(sql)
+    return [next(iter(row.values())) for row in cur.fetchall()]
+
+
+def base_counts(cur):
+    cur.execute("""
+        SELECT (SELECT COUNT(*) FROM customer) AS customers,
+               (SELECT COUNT(*) FROM inventory) AS inventory,
+               (SELECT COUNT(*) FROM rental) AS rentals,
+               (SELECT COALESCE(MAX(customer_id), 0) FROM customer) AS max_customer_id,
+               (SELECT COALESCE(MAX(inventory_id), 0) FROM inventory) AS max_inventory_id
+    """)
+    return cur.fetchone()
+
+
+# id columns the new rows have to fit in: (key in base_counts, max_* key, columns)
+ID_COLUMNS = [
+    ("customers", "max_customer_id", [("customer", "customer_id"), ("rental", "customer_id"),
+                                      ("payment", "customer_id"), ("customer_rental_summary", "customer_id")]),
+    ("inventory", "max_inventory_id", [("inventory", "inventory_id"), ("rental", "inventory_id")]),
+]
+_INT_MAX = {"tinyint": 127, "smallint": 32767, "mediumint": 8388607, "int": 2147483647, "bigint": 2 ** 63 - 1}
+
+
+def column_max(cur, table, column):
+    # largest value the integer column can hold, None if the column does not exist
+    cur.execute("""
+        SELECT DATA_TYPE AS data_type, COLUMN_TYPE AS column_type FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    limit = _INT_MAX[row["data_type"].lower()]
+    return limit * 2 + 1 if "unsigned" in row["column_type"].lower() else limit
+
+
+def check_id_ranges(cur, base, extra):
+    # Stock Sakila keys customers by SMALLINT UNSIGNED (at most 65535), which a
+    # large --scale overflows halfway through the load; refuse before inserting
+    problems = []
+    for key, max_key, columns in ID_COLUMNS:
+        needed = base[max_key] + extra[key]
+        for table, column in columns:
+            limit = column_max(cur, table, column)
+            if limit is not None and needed > limit:
+                problems.append(f"{table}.{column} holds at most {limit}, the seed needs ids up to {needed}")
+    if problems:
+        raise SystemExit("this --scale does not fit the schema:\n  " + "\n  ".join(problems)
+                         + "\nwiden these columns (e.g. to INT UNSIGNED) or use a smaller --scale")
+
+
+def _check_trigger_privileges(cur, tables):
+    # create and drop a no-op trigger on each table, so a missing privilege
+    # stops the run before anything is dropped or inserted
+    for table in tables:
+        try:
+            cur.execute(f"CREATE TRIGGER seed_data_probe BEFORE INSERT ON {table} "
+                        "FOR EACH ROW SET @seed_data_probe = 1")
+            cur.execute("DROP TRIGGER seed_data_probe")
+        except pymysql.MySQLError as e:
+            raise SystemExit(f"seed_data.py needs to drop and recreate triggers on {table}: {e.args[-1]}. "
+                             "Grant TRIGGER (and SUPER or set log_bin_trust_function_creators "
+                             "when binary logging is on) and run it again.")
+
+
+@contextmanager
+def suspended_triggers(conn, names, log=print):
+    # drops the named triggers for the duration of the block and recreates
+    # them, owned by the current user, even if the load fails
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT TRIGGER_NAME, EVENT_OBJECT_TABLE FROM information_schema.TRIGGERS
+        WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME IN %s
+    """, (tuple(names),))
+    present = {row["TRIGGER_NAME"]: row["EVENT_OBJECT_TABLE"] for row in cur.fetchall()}
+    _check_trigger_privileges(cur, sorted(set(present.values())))
+    definitions = {}
+    for name in present:
+        cur.execute(f"SHOW CREATE TRIGGER `{name}`")
+        definitions[name] = _DEFINER.sub("", cur.fetchone()["SQL Original Statement"], count=1)
+    dropped = []
+    try:
+        for name in present:
+            # printed first so a killed run can be repaired by hand
+            log(f"dropping trigger {name} for the load; it is restored with: {definitions[name]}")
+            cur.execute(f"DROP TRIGGER `{name}`")
+            dropped.append(name)
+        yield
+    finally:
+        for name in dropped:
+            try:
+                cur.execute(definitions[name])
+                log(f"trigger {name} restored")
+            except pymysql.MySQLError as e:
+                log(f"FAILED to restore trigger {name} ({e.args[-1]}), run by hand: {definitions[name]}")
+        cur.close()
+
+
+def insert_batches(conn, sql, rows):
+    cur = conn.cursor()
+    batch, total = [], 0
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) == BATCH:
+                cur.executemany(sql, batch)
+                conn.commit()
+                total += len(batch)
+                batch = []
+        if batch:
+            cur.executemany(sql, batch)
+            conn.commit()
+            total += len(batch)
+    finally:
+        cur.close()
+    return total
+
+
+def customer_rows(cur, count, rng):
+    first_names = _column(cur, "SELECT DISTINCT first_name FROM customer ORDER BY first_name")
+    last_names = _column(cur, "SELECT DISTINCT last_name FROM customer ORDER BY last_name")
+    addresses = _column(cur, "SELECT address_id FROM address ORDER BY address_id")
+    stores = _column(cur, "SELECT store_id FROM store ORDER BY store_id")
+    for n in range(count):
+        first, last = rng.choice(first_names), rng.choice(last_names)
+        created = START - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86399))
+        yield (rng.choice(stores), first, last, f"{first}.{last}.{n}@{EMAIL_DOMAIN}".lower()[:50],
+               rng.choice(addresses), int(rng.random() < 0.97), created)
+
+
+def inventory_rows(count, popularity, stores, rng):
+    # copies roughly follow sqrt(popularity): hits get more, not proportionally more
+    choose_film = Chooser(list(popularity), [w ** 0.5 for w in popularity.values()], rng)
+    for _ in range(count):
+        yield choose_film(), rng.choice(stores)
+
+
+def rental_rows(copies, weight_sum, total, popularity, durations, staff, choose_customer, rng):
+    # copies: (inventory_id, film_id, store_id) in inventory_id order; each copy
+    # gets its film's share of the total
+    span = (END - START).total_seconds()
+    for inventory_id, film_id, store_id in copies:
+        expected = total * popularity[film_id] / weight_sum
+        n = int(expected) + (rng.random() < expected - int(expected))
+        starts = sorted(START + timedelta(seconds=rng.random() * span) for _ in range(n))
+        for i, start in enumerate(starts):
+            last = i == len(starts) - 1
+            returned = start + timedelta(days=durations[film_id] + rng.randint(-2, 3), seconds=rng.randint(0, 86399))
+            if not last:
+                returned = min(returned, starts[i + 1] - timedelta(minutes=1))
+                if returned <= start:
+                    continue  # two checkouts minutes apart; keep the later one
+            elif returned > END or rng.random() < OPEN_RATE:
+                returned = None
+            yield start, inventory_id, choose_customer(), returned, rng.choice(staff[store_id])
+
+
+def seed(scale, seed_value=42, log=print):
+    rng = random.Random(seed_value)
+    with get_conn() as conn:
+        cur = conn.cursor()
+        base = base_counts(cur)
+        films = _column(cur, "SELECT film_id FROM film ORDER BY film_id")
+        cur.execute("SELECT film_id, rental_duration FROM film")
+        durations = {row["film_id"]: row["rental_duration"] for row in cur.fetchall()}
+        stores = _column(cur, "SELECT store_id FROM store ORDER BY store_id")
+        cur.execute("SELECT staff_id, store_id FROM staff ORDER BY staff_id")
+        staff = {}
+        for row in cur.fetchall():
+            staff.setdefault(row["store_id"], []).append(row["staff_id"])
+        all_staff = [s for ids in staff.values() for s in ids]
+        for store_id in stores:
+            staff.setdefault(store_id, all_staff)
+        popularity = dict(zip(films, zipf_weights(len(films), FILM_SKEW, rng)))
+
+        extra = {key: base[key] * (scale - 1) for key in ("customers", "inventory", "rentals")}
+        check_id_ranges(cur, base, extra)
+
+        with suspended_triggers(conn, DATE_TRIGGERS, log):
+            start = time.perf_counter()
+            counts = {}
+            counts["customers"] = insert_batches(conn, CUSTOMER_INSERT_SQL, customer_rows(cur, extra["customers"], rng))
+            log(f"customers: +{counts['customers']}")
+            counts["inventory"] = insert_batches(conn, INVENTORY_INSERT_SQL,
+                                                 inventory_rows(extra["inventory"], popularity, stores, rng))
+            log(f"inventory: +{counts['inventory']}")
+
+            customers = _column(cur, "SELECT customer_id FROM customer ORDER BY customer_id")
+            choose_customer = Chooser(customers, zipf_weights(len(customers), CUSTOMER_SKEW, rng), rng)
+
+            cur.execute("""
+                SELECT film_id, COUNT(*) AS copies FROM inventory
+                WHERE inventory_id > %s GROUP BY film_id
+            """, (base["max_inventory_id"],))
+            weight_sum = sum(popularity[row["film_id"]] * row["copies"] for row in cur.fetchall())
+            cur.close()
+
+            # stream the new copies on a second connection while this one inserts
+            with get_conn() as reader:
+                copies = reader.cursor(pymysql.cursors.SSCursor)
+                try:
+                    copies.execute("""
+                        SELECT inventory_id, film_id, store_id FROM inventory
+                        WHERE inventory_id > %s ORDER BY inventory_id
+                    """, (base["max_inventory_id"],))
+                    rows = rental_rows(copies, weight_sum, extra["rentals"], popularity, durations, staff,
+                                       choose_customer, rng)
+                    counts["rentals"] = insert_batches(conn, RENTAL_INSERT_SQL, rows)
+                finally:
+                    copies.close()
+            log(f"rentals: +{counts['rentals']}")
+
+        rollup.rebuild(conn)
+        log(f"rollup rebuilt, {time.perf_counter() - start:.0f}s total")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grow a stock Sakila database with deterministic synthetic data")
+    parser.add_argument("--scale", type=int, choices=SCALES, required=True,
+                        help="final size of customer, inventory and rental relative to now")
+    parser.add_argument("--seed", type=int, default=42, help="same seed and starting data, same rows")
+    args = parser.parse_args()
+    seed(args.scale, args.seed, log=lambda msg: print(msg, file=sys.stderr))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,89 +1,193 @@
-from flask import Flask, jsonify, request
+import base64
+import binascii
+import io
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from flask import Flask, Response, g, has_request_context, jsonify, request, stream_with_context
 from flask_cors import CORS
-from db import get_conn
+import db
+from db import get_conn, PoolExhausted
+import rollup
+import cache
+import search
+import catalog
+import inventory
+import import_customers
+import export
+import metrics
+import profiler
+import indexes
+import traffic
+import json_provider
 
 app = Flask(__name__)
+json_provider.init_app(app)
 CORS(app)
+metrics.init_app(app)
+profiler.init_app(app)
+traffic.init_app(app)
 
+MAX_PER_PAGE = 100
+
+
+@app.errorhandler(PoolExhausted)
+def pool_exhausted(e):
+    return jsonify({"error": "Database busy, try again later"}), 503
+
+
+# Read-your-writes with DB_REPLICAS: a client that wrote in the last
+# DB_STICKY_SECONDS carries a cookie that keeps its reads on the primary.
+STICKY_COOKIE = "db_primary_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+@app.before_request
+def pin_reads_after_write():
+    try:
+        until = float(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        until = 0
+    g.db_primary = request.method not in SAFE_METHODS or until > time.time()
+
+
+@app.after_request
+def mark_write(response):
+    if db.DB_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400:
+        response.set_cookie(STICKY_COOKIE, str(time.time() + db.DB_STICKY_SECONDS),
+                            max_age=int(db.DB_STICKY_SECONDS) + 1, httponly=True)
+    return response
+
+
+db.prefer_primary = lambda: has_request_context() and g.get("db_primary", False)
 
 
 #Feature 1 top 5 films
 @app.route('/api/films/top', methods=['GET'])
 def top_films():
+    # film_rental_count is maintained by rollup.record_rental, see rollup.py
     sql = """
-        SELECT f.film_id, f.title, c.name AS category, COUNT(*) AS rentals
-        FROM rental r
-        JOIN inventory i ON r.inventory_id = i.inventory_id
-        JOIN film f ON i.film_id = f.film_id
+        SELECT f.film_id, f.title, c.name AS category, frc.rentals
+        FROM film_rental_count frc
+        JOIN film f ON frc.film_id = f.film_id
         JOIN film_category fc ON f.film_id = fc.film_id
         JOIN category c ON fc.category_id = c.category_id
-        GROUP BY f.film_id, f.title, c.name
-        ORDER BY rentals DESC
+        ORDER BY frc.rentals DESC
         LIMIT 5;
     """
-    conn = get_conn()
-    try:
-        cur = conn.cursor()  # correct for mysql-connector-python
-        cur.execute(sql)
-        rows = cur.fetchall()  # list of dicts
-        cur.close()
-        return jsonify(rows)
-    finally:
-        conn.close()
+    def load():
+        with get_conn(read_only=True) as conn:
+            cur = conn.cursor()  # correct for mysql-connector-python
+            cur.execute(sql)
+            rows = cur.fetchall()  # list of dicts
+            cur.close()
+            return rows
+
+    return json_provider.cached_response(cache.TOP_FILMS, load)
+
+MAX_BATCH_FILMS = 300
+
+
+def load_films(film_ids):
+    # film_id -> details from the catalog snapshot; only the live copy count hits MySQL
+    snapshot = catalog.get()
+    # films without a category never matched the old film_category join, keep them out
+    films = {i: snapshot.films[i].to_dict() for i in film_ids if i in snapshot.films and snapshot.films[i].categories}
+    if films:
+        with get_conn(read_only=True) as conn:
+            cur = conn.cursor()
+            available = inventory.available_copies(cur, sorted(films))
+            cur.close()
+        for film_id, film in films.items():
+            film['available_copies'] = available[film_id]
+    return films
+
 
 #Feature 2 film details
 @app.route("/api/films/<int:film_id>", methods=["GET"])
 def get_film_details(film_id):
-    sql = """
-        SELECT f.film_id AS film_id, f.title, f.description, f.release_year, f.rating, f.rental_duration, f.rental_rate, f.length, f.replacement_cost, c.name AS category_name
-        FROM film AS f
-        JOIN film_category AS fc ON f.film_id = fc.film_id
-        JOIN category AS c ON fc.category_id = c.category_id
-        WHERE f.film_id = %s;
-    """
-    conn = get_conn()
+    row = cache.get_or_load(cache.film_key(film_id), lambda: load_films([film_id]).get(film_id))
+    if row:
+        return jsonify(row)
+    else:
+        return jsonify({"error": "Film not found"}), 404
+
+# batch version of Feature 2: /api/films?ids=1,2,3, shares the per-film cache entries
+@app.route("/api/films", methods=["GET"])
+def get_films():
     try:
-        cur = conn.cursor()
-        cur.execute(sql, (film_id,))
-        row = cur.fetchone()  # just one film
-        cur.close()
-        if row:
-            return jsonify(row)
-        else:
-            return jsonify({"error": "Film not found"}), 404
-    finally:
-        conn.close()
+        film_ids = list(dict.fromkeys(int(i) for i in request.args.get("ids", "").split(",") if i.strip()))
+    except ValueError:
+        return jsonify({"error": "ids must be a comma separated list of film ids"}), 400
+    if not film_ids:
+        return jsonify({"error": "ids is required"}), 400
+    if len(film_ids) > MAX_BATCH_FILMS:
+        return jsonify({"error": f"At most {MAX_BATCH_FILMS} ids per request"}), 400
+
+    films = cache.get_many_or_load(film_ids, cache.film_key, load_films)
+    return jsonify({
+        "films": [films[i] for i in film_ids if i in films],
+        "not_found": [i for i in film_ids if i not in films],
+    })
 
 #Feature 4 view top 5 actors
 @app.route("/api/actors/top", methods=["GET"])
 def top_actors():
     sql = """
-        SELECT a.actor_id, CONCAT(a.first_name, ' ', a.last_name) AS name, COUNT(*) AS film_count
-        FROM actor a
-        JOIN film_actor fa ON a.actor_id = fa.actor_id
-        JOIN film f ON fa.film_id = f.film_id
-        JOIN inventory i ON f.film_id = i.film_id
-        JOIN rental r ON i.inventory_id = r.inventory_id
-        GROUP BY a.actor_id, a.first_name, a.last_name
-        ORDER BY film_count DESC
+        SELECT a.actor_id, CONCAT(a.first_name, ' ', a.last_name) AS name, arc.rentals AS film_count
+        FROM actor_rental_count arc
+        JOIN actor a ON arc.actor_id = a.actor_id
+        ORDER BY arc.rentals DESC
         LIMIT 5;
     """
-    conn = get_conn()
+    def load():
+        with get_conn(read_only=True) as conn:
+            cur = conn.cursor()
+            cur.execute(sql)
+            rows = cur.fetchall()
+            cur.close()
+            return rows
+
+    return json_provider.cached_response(cache.TOP_ACTORS, load)
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(dict(cache.backend.stats(), singleflight=cache.flights.stats()))
+
+
+@app.route("/api/db/stats", methods=["GET"])
+def db_stats():
+    return jsonify(db.stats())
+
+
+@app.route("/api/catalog/stats", methods=["GET"])
+def catalog_stats():
+    return jsonify(catalog.get().stats())
+
+
+def encode_cursor(customer_id):
+    return base64.urlsafe_b64encode(f"c{customer_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
     try:
-        cur = conn.cursor()
-        cur.execute(sql)
-        rows = cur.fetchall()
-        cur.close()
-        return jsonify(rows)
-    finally:
-        conn.close()
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError, ValueError):  # ValueError: non-ASCII token
+        return None
+    # isdigit() alone also accepts digits like "²" that int() rejects
+    if not raw.startswith("c") or not raw[1:].isascii() or not raw[1:].isdigit():
+        return None
+    return int(raw[1:])
 
 
 #Feature 5,6 view and search customers
+# ?page=N pages with OFFSET; ?after=<cursor> (empty for the first page) seeks on customer_id instead
 @app.route("/api/customers", methods=["GET"])
 def get_customers():
-    page = int(request.args.get("page", 1))
-    per_page = int(request.args.get("per_page", 10))
+    page = max(int(request.args.get("page", 1)), 1)
+    per_page = min(max(int(request.args.get("per_page", 10)), 1), MAX_PER_PAGE)
 
     customer_id = request.args.get("id")
     first_name = request.args.get("first_name")
@@ -91,9 +195,12 @@ def get_customers():
 
     offset = (page - 1) * per_page
 
-    conn = get_conn()
-    cur = conn.cursor()
-
+    after = request.args.get("after")
+    after_id = 0
+    if after:
+        after_id = decode_cursor(after)
+        if after_id is None:
+            return jsonify({"error": "Invalid cursor"}), 400
 
     query = "SELECT customer_id, first_name, last_name, email FROM customer WHERE 1=1"
     params = []
@@ -108,58 +215,59 @@ def get_customers():
         query += " AND last_name LIKE %s"
         params.append(f"%{last_name}%")
 
-    query += " LIMIT %s OFFSET %s"
-    params.extend([per_page, offset])
+    if after is not None:
+        query += " AND customer_id > %s ORDER BY customer_id LIMIT %s"
+        params.extend([after_id, per_page + 1])
+    else:
+        query += " LIMIT %s OFFSET %s"
+        params.extend([per_page, offset])
 
-    cur.execute(query, params)
-    customers = cur.fetchall()
+    with get_conn(read_only=True) as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        customers = cur.fetchall()
+        cur.close()
 
-    cur.close()
-    conn.close()
+    if after is not None:
+        next_cursor = None
+        if len(customers) > per_page:
+            customers = customers[:per_page]
+            next_cursor = encode_cursor(customers[-1]["customer_id"])
+        return jsonify({"customers": customers, "next_cursor": next_cursor})
 
     return jsonify(customers)
 
 #Feature 4: Actor Details
 @app.route("/api/actors/<int:actor_id>", methods=["GET"])
 def get_actor_details(actor_id):
-    conn = get_conn()
-    cursor = conn.cursor()
-
-    #actor details
-    cursor.execute(
-        """
-        SELECT actor_id, first_name, last_name
-        FROM actor
-        WHERE actor_id = %s
-        """,
-        (actor_id,),
-    )
-    actor = cursor.fetchone()
+    snapshot = catalog.get()
+    actor = snapshot.actors.get(actor_id)
 
     if not actor:
         return jsonify({"error": "Actor not found"}), 404
 
-    #top 5 rented films for this actor
-    cursor.execute(
-        """
-        SELECT f.film_id, f.title, COUNT(r.rental_id) AS rental_count
-        FROM film f
-        INNER JOIN film_actor fa ON f.film_id = fa.film_id
-        INNER JOIN inventory i ON f.film_id = i.film_id
-        INNER JOIN rental r ON i.inventory_id = r.inventory_id
-        WHERE fa.actor_id = %s
-        GROUP BY f.film_id, f.title
-        ORDER BY rental_count DESC
-        LIMIT 5
-        """,
-        (actor_id,),
-    )
-    films = cursor.fetchall()
-
-    cursor.close()
+    #top 5 rented films for this actor, counts from the rollup (see rollup.py)
+    films = []
+    if actor.film_ids:
+        with get_conn(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT film_id, rentals AS rental_count
+                FROM film_rental_count
+                WHERE film_id IN ({}) AND rentals > 0
+                ORDER BY rentals DESC
+                LIMIT 5
+                """.format(", ".join(["%s"] * len(actor.film_ids))),
+                list(actor.film_ids),
+            )
+            films = cursor.fetchall()
+            cursor.close()
+        for film in films:
+            film['title'] = snapshot.films[film['film_id']].title
 
     return jsonify({
-        "actor": actor,
+        "actor": actor.to_dict(),
         "top_films": films
     })
 
@@ -175,18 +283,17 @@ def add_customer():
     store_id = data.get('store_id', 1)
     active = 1
 
-    conn = get_conn()
-    cur = conn.cursor()
     sql = """
         INSERT INTO customer (store_id, first_name, last_name, email, address_id, active, create_date)
         VALUES (%s, %s, %s, %s, %s, %s, NOW())
     """
-    cur.execute(sql, (store_id, first_name, last_name, email, address_id, active))
-    conn.commit()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, (store_id, first_name, last_name, email, address_id, active))
+        conn.commit()
 
-    new_id = cur.lastrowid
-    cur.close()
-    conn.close()
+        new_id = cur.lastrowid
+        cur.close()
 
     return jsonify({
         "customer_id": new_id,
@@ -195,6 +302,26 @@ def add_customer():
         "email": email
     }), 201
 
+BULK_FORMATS = {"application/json": "json", "application/x-ndjson": "ndjson", "text/csv": "csv"}
+
+#Feature 7b: Bulk customer import (JSON array, NDJSON or CSV body), see import_customers.py
+@app.route('/api/customers/bulk', methods=['POST'])
+def add_customers_bulk():
+    fmt = request.args.get('format') or BULK_FORMATS.get(request.mimetype)
+    if fmt not in import_customers.READERS:
+        return jsonify({"error": "Send application/json, application/x-ndjson or text/csv, or pass ?format="}), 415
+    try:
+        chunk_size = min(max(int(request.args.get('chunk_size', import_customers.DEFAULT_CHUNK_SIZE)), 1), 10000)
+    except ValueError:
+        return jsonify({"error": "chunk_size must be an integer"}), 400
+
+    stream = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    try:
+        report = import_customers.import_customers(stream, fmt, chunk_size)
+    except ValueError as e:
+        return jsonify({"error": f"Could not parse body: {e}"}), 400
+    return jsonify(report), 201 if report["inserted"] else 400
+
 #Feature 8: Update customer
 @app.route('/api/customers/<int:customer_id>', methods=['PUT'])
 def update_customer(customer_id):
@@ -203,26 +330,24 @@ def update_customer(customer_id):
     last_name = data.get('last_name')
     email = data.get('email')
 
-    conn = get_conn()
-    cur = conn.cursor()
-    
-    cur.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (customer_id,))
-    if not cur.fetchone():
-        cur.close()
-        conn.close()
-        return jsonify({"error": "Customer not found"}), 404
-    
+    with get_conn() as conn:
+        cur = conn.cursor()
 
-    sql = """
-        UPDATE customer 
-        SET first_name = %s, last_name = %s, email = %s
-        WHERE customer_id = %s
-    """
-    cur.execute(sql, (first_name, last_name, email, customer_id))
-    conn.commit()
-    
-    cur.close()
-    conn.close()
+        cur.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (customer_id,))
+        if not cur.fetchone():
+            cur.close()
+            return jsonify({"error": "Customer not found"}), 404
+
+
+        sql = """
+            UPDATE customer 
+            SET first_name = %s, last_name = %s, email = %s
+            WHERE customer_id = %s
+        """
+        cur.execute(sql, (first_name, last_name, email, customer_id))
+        conn.commit()
+
+        cur.close()
 
     return jsonify({
         "customer_id": customer_id,
@@ -234,64 +359,108 @@ def update_customer(customer_id):
 #Feature 9: Delete customer
 @app.route('/api/customers/<int:customer_id>', methods=['DELETE'])
 def delete_customer(customer_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    
+    with get_conn() as conn:
+        cur = conn.cursor()
 
-    cur.execute("SELECT customer_id, first_name, last_name FROM customer WHERE customer_id = %s", (customer_id,))
-    customer = cur.fetchone()
-    if not customer:
-        cur.close()
-        conn.close()
-        return jsonify({"error": "Customer not found"}), 404
-    
 
-    cur.execute("DELETE FROM customer WHERE customer_id = %s", (customer_id,))
-    conn.commit()
-    
-    cur.close()
-    conn.close()
+        cur.execute("SELECT customer_id, first_name, last_name FROM customer WHERE customer_id = %s", (customer_id,))
+        customer = cur.fetchone()
+        if not customer:
+            cur.close()
+            return jsonify({"error": "Customer not found"}), 404
+
+
+        cur.execute("DELETE FROM customer WHERE customer_id = %s", (customer_id,))
+        conn.commit()
+
+        cur.close()
 
     return jsonify({
         "message": f"Customer {customer[1]} {customer[2]} has been deleted successfully",
         "customer_id": customer_id
     }), 200
 
-#Feature 10: Get customer details and rental history
-@app.route('/api/customers/<int:customer_id>/details', methods=['GET'])
-def get_customer_details(customer_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    
+class RentalStats:
+    # the numbers the old COUNT/SUM query produced, accumulated from history rows
+    def __init__(self):
+        self.total = 0
+        self.current = 0
+        self.spent = Decimal("0.00")
+
+    def add(self, rental):
+        self.total += 1
+        if rental['return_date'] is None:
+            self.current += 1
+        else:
+            self.spent += rental['rental_rate']
+
+    def result(self):
+        return {
+            "total_rentals": self.total,
+            "current_rentals": self.current,
+            "completed_rentals": self.total - self.current,
+            "total_spent": self.spent if self.total else None,
+        }
+
+
+def rental_stats(rentals):
+    stats = RentalStats()
+    for rental in rentals:
+        stats.add(rental)
+    return stats.result()
+
+
+def encode_history_cursor(rental):
+    raw = f"{rental['rental_date'].isoformat()}|{rental['rental_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_history_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        rental_date, rental_id = raw.split("|")
+        return datetime.fromisoformat(rental_date), int(rental_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+MAX_HISTORY_PAGE = 500
+HISTORY_STREAM_CHUNK = 500
+
+HISTORY_SQL = """
+    SELECT r.rental_id, f.title, f.rental_rate, r.rental_date, r.return_date,
+           CASE 
+               WHEN r.return_date IS NULL THEN 'Currently Rented'
+               ELSE 'Returned'
+           END as status,
+           DATEDIFF(COALESCE(r.return_date, NOW()), r.rental_date) as days_rented
+    FROM rental r
+    JOIN inventory i ON r.inventory_id = i.inventory_id
+    JOIN film f ON i.film_id = f.film_id
+    WHERE r.customer_id = %s {where}
+    ORDER BY r.rental_date DESC, r.rental_id DESC
+    {limit}
+"""
+
+CUSTOMER_DETAILS_SQL = """
+    SELECT customer_id, first_name, last_name, email, 
+           address_id, active, create_date
+    FROM customer 
+    WHERE customer_id = %s
+"""
+
+
+def summary_stats(cur, customer_id):
     cur.execute("""
-        SELECT customer_id, first_name, last_name, email, 
-               address_id, active, create_date
-        FROM customer 
+        SELECT total_rentals, current_rentals,
+               total_rentals - current_rentals AS completed_rentals, total_spent
+        FROM customer_rental_summary
         WHERE customer_id = %s
     """, (customer_id,))
-    customer = cur.fetchone()
-    
-    if not customer:
-        cur.close()
-        conn.close()
-        return jsonify({"error": "Customer not found"}), 404
-    
-    cur.execute("""
-        SELECT r.rental_id, f.title, f.rental_rate, r.rental_date, r.return_date,
-               CASE 
-                   WHEN r.return_date IS NULL THEN 'Currently Rented'
-                   ELSE 'Returned'
-               END as status,
-               DATEDIFF(COALESCE(r.return_date, NOW()), r.rental_date) as days_rented
-        FROM rental r
-        JOIN inventory i ON r.inventory_id = i.inventory_id
-        JOIN film f ON i.film_id = f.film_id
-        WHERE r.customer_id = %s
-        ORDER BY r.rental_date DESC
-    """, (customer_id,))
-    rentals = cur.fetchall()
-    
+    return cur.fetchone()
 
+
+def aggregate_stats(cur, customer_id):
     cur.execute("""
         SELECT 
             COUNT(*) as total_rentals,
@@ -303,40 +472,201 @@ def get_customer_details(customer_id):
         JOIN film f ON i.film_id = f.film_id
         WHERE r.customer_id = %s
     """, (customer_id,))
-    stats = cur.fetchone()
-    
-    cur.close()
-    conn.close()
-    
-    return jsonify({
+    return cur.fetchone()
+
+
+#Feature 10: Get customer details and rental history
+# ?stats=summary     statistics from customer_rental_summary (see rollup.py)
+# ?limit=N&before=C  one page of history, newest first, plus next_cursor
+# ?stream=1          whole history streamed from a server-side cursor
+@app.route('/api/customers/<int:customer_id>/details', methods=['GET'])
+def get_customer_details(customer_id):
+    if request.args.get('stream') in ('1', 'true'):
+        return stream_customer_details(customer_id)
+
+    use_summary = request.args.get('stats') == 'summary'
+    paged = 'limit' in request.args or 'before' in request.args
+    limit = min(max(int(request.args.get('limit', 50)), 1), MAX_HISTORY_PAGE)
+
+    where, params = "", [customer_id]
+    before = request.args.get('before')
+    if before:
+        position = decode_history_cursor(before)
+        if position is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+        where = "AND (r.rental_date < %s OR (r.rental_date = %s AND r.rental_id < %s))"
+        params += [position[0], position[0], position[1]]
+
+    with get_conn(read_only=True) as conn:
+        cur = conn.cursor()
+
+        cur.execute(CUSTOMER_DETAILS_SQL, (customer_id,))
+        customer = cur.fetchone()
+
+        if not customer:
+            cur.close()
+            return jsonify({"error": "Customer not found"}), 404
+
+        if paged:
+            cur.execute(HISTORY_SQL.format(where=where, limit="LIMIT %s"), params + [limit + 1])
+        else:
+            cur.execute(HISTORY_SQL.format(where="", limit=""), (customer_id,))
+        rentals = cur.fetchall()
+
+        stats = None
+        if use_summary or paged:
+            stats = summary_stats(cur, customer_id)
+        if stats is None and paged:
+            # a page is not the whole history, so it cannot be summed up locally
+            stats = aggregate_stats(cur, customer_id)
+
+        cur.close()
+
+    if stats is None:
+        stats = rental_stats(rentals)
+
+    result = {
         "customer": customer,
         "rentals": rentals,
         "statistics": stats
-    })
+    }
+    if paged:
+        result["next_cursor"] = None
+        if len(rentals) > limit:
+            del rentals[limit:]
+            result["next_cursor"] = encode_history_cursor(rentals[-1])
+    return jsonify(result)
+
+
+def stream_customer_details(customer_id):
+    conn = get_conn(read_only=True)
+    try:
+        cur = conn.cursor()
+        cur.execute(CUSTOMER_DETAILS_SQL, (customer_id,))
+        customer = cur.fetchone()
+        cur.close()
+    except Exception:
+        conn.close()
+        raise
+    if not customer:
+        conn.close()
+        return jsonify({"error": "Customer not found"}), 404
+
+    dumps = app.json.dumps
+
+    def generate():
+        try:
+            yield '{"customer": ' + dumps(customer) + ', "rentals": ['
+            stats = RentalStats()
+            first = True
+            chunks = export.read_chunks(conn, HISTORY_SQL.format(where="", limit=""), (customer_id,),
+                                        size=HISTORY_STREAM_CHUNK)
+            for rows in chunks:
+                parts = []
+                for row in rows:
+                    stats.add(row)
+                    parts.append(dumps(row))
+                yield ("" if first else ", ") + ", ".join(parts)
+                first = False
+            yield '], "statistics": ' + dumps(stats.result()) + '}'
+        finally:
+            conn.close()
+
+    # keep the request context while streaming so the history query is
+    # attributed to this endpoint rather than to "background"
+    response = Response(stream_with_context(generate()), mimetype="application/json")
+    # releases the connection even if the body is never iterated
+    response.call_on_close(conn.close)
+    return response
 
 #Feature 11: Return movie
 @app.route('/api/rentals/<int:rental_id>/return', methods=['PUT'])
 def return_rental(rental_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    
-    cur.execute("SELECT rental_id FROM rental WHERE rental_id = %s", (rental_id,))
-    rental = cur.fetchone()
-    if not rental:
+    with get_conn() as conn:
+        cur = conn.cursor()
+
+        cur.execute("""
+            SELECT r.rental_id, i.film_id
+            FROM rental r
+            JOIN inventory i ON r.inventory_id = i.inventory_id
+            WHERE r.rental_id = %s
+        """, (rental_id,))
+        rental = cur.fetchone()
+        if not rental:
+            cur.close()
+            return jsonify({"error": "Rental not found"}), 404
+
+        cur.execute("UPDATE rental SET return_date = NOW() WHERE rental_id = %s AND return_date IS NULL", (rental_id,))
+        if cur.rowcount:
+            rollup.record_return(cur, rental_id)
+            inventory.record_return(cur, rental_id)
+        conn.commit()
+
         cur.close()
-        conn.close()
-        return jsonify({"error": "Rental not found"}), 404
 
-    cur.execute("UPDATE rental SET return_date = NOW() WHERE rental_id = %s AND return_date IS NULL", (rental_id,))
-    conn.commit()
-    
-    cur.close()
-    conn.close()
+    cache.invalidate(cache.film_key(rental['film_id']))
 
     return jsonify({"message": f"Rental {rental_id} marked as returned"}), 200
 
 
-#Feature 12: Search films by title, actor, or genre
+MAX_BATCH_RETURNS = 1000
+
+#Feature 11b: Return a drop-box full of rentals at once
+@app.route('/api/rentals/return', methods=['PUT'])
+def return_rentals():
+    data = request.get_json()
+    rental_ids = data.get('rental_ids') if isinstance(data, dict) else None
+
+    if not isinstance(rental_ids, list) or not rental_ids:
+        return jsonify({"error": "A list of Rental IDs is required"}), 400
+    if len(rental_ids) > MAX_BATCH_RETURNS:
+        return jsonify({"error": f"At most {MAX_BATCH_RETURNS} rentals per request"}), 400
+    # int(True) is 1, so booleans would quietly return rental 1
+    if any(isinstance(rental_id, bool) for rental_id in rental_ids):
+        return jsonify({"error": "Rental IDs must be integers"}), 400
+    try:
+        rental_ids = list(dict.fromkeys(int(rental_id) for rental_id in rental_ids))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Rental IDs must be integers"}), 400
+
+    placeholders = ", ".join(["%s"] * len(rental_ids))
+    with get_conn() as conn:
+        cur = conn.cursor()
+
+        # lock the rows so the returned/already-returned split cannot change under us
+        cur.execute(f"""
+            SELECT r.rental_id, r.return_date, i.film_id
+            FROM rental r
+            JOIN inventory i ON r.inventory_id = i.inventory_id
+            WHERE r.rental_id IN ({placeholders})
+            FOR UPDATE
+        """, rental_ids)
+        found = {row['rental_id']: row for row in cur.fetchall()}
+
+        to_return = [i for i in rental_ids if i in found and found[i]['return_date'] is None]
+        if to_return:
+            cur.execute(
+                "UPDATE rental SET return_date = NOW() WHERE return_date IS NULL AND rental_id IN ({})".format(
+                    ", ".join(["%s"] * len(to_return))),
+                to_return,
+            )
+            rollup.record_returns(cur, to_return)
+            inventory.record_returns(cur, to_return)
+        conn.commit()
+
+        cur.close()
+
+    if to_return:
+        cache.invalidate(*{cache.film_key(found[i]['film_id']) for i in to_return})
+
+    return jsonify({
+        "returned": to_return,
+        "already_returned": [i for i in rental_ids if i in found and found[i]['return_date'] is not None],
+        "not_found": [i for i in rental_ids if i not in found],
+    }), 200
+
+
+#Feature 12: Search films by title, actor, genre, or all three
 @app.route('/api/films/search', methods=['GET'])
 def search_films():
     query = request.args.get('q', '').strip()
@@ -345,48 +675,25 @@ def search_films():
     if not query:
         return jsonify([])
 
-    conn = get_conn()
-    cur = conn.cursor()
-
-    if search_type == 'actor':
-        sql = """
-            SELECT DISTINCT f.film_id, f.title
-            FROM film f
-            JOIN film_actor fa ON f.film_id = fa.film_id
-            JOIN actor a ON fa.actor_id = a.actor_id
-            WHERE CONCAT(a.first_name, ' ', a.last_name) LIKE %s
-            ORDER BY f.title
-            LIMIT 50
-        """
-        params = (f"%{query}%",)
-    elif search_type == 'genre':
-        sql = """
-            SELECT DISTINCT f.film_id, f.title
-            FROM film f
-            JOIN film_category fc ON f.film_id = fc.film_id
-            JOIN category c ON fc.category_id = c.category_id
-            WHERE c.name LIKE %s
-            ORDER BY f.title
-            LIMIT 50
-        """
-        params = (f"%{query}%",)
-    else:
-        sql = """
-            SELECT f.film_id, f.title
-            FROM film f
-            WHERE f.title LIKE %s
-            ORDER BY f.title
-            LIMIT 50
-        """
-        params = (f"%{query}%",)
-
-    try:
-        cur.execute(sql, params)
-        rows = cur.fetchall()
-        return jsonify(rows)
-    finally:
-        cur.close()
-        conn.close()
+    if search_type not in ('title', 'actor', 'genre', 'all'):
+        search_type = 'title'
+
+    # served from the in-memory index in search.py, ranked by relevance then title
+    rows = search.get_index().search(query, search_type, limit=50)
+    if rows:
+        with get_conn(read_only=True) as conn:
+            cur = conn.cursor()
+            available = inventory.available_copies(cur, [row['film_id'] for row in rows])
+            cur.close()
+        for row in rows:
+            row['available_copies'] = available[row['film_id']]
+    return jsonify(rows)
+
+@app.route('/api/films/autocomplete', methods=['GET'])
+def autocomplete_films():
+    prefix = request.args.get('prefix', '')
+    limit = min(max(int(request.args.get('limit', 10)), 1), 25)
+    return jsonify(search.get_autocomplete().complete(prefix, limit))
 
 #Feature 13: Rent film
 @app.route('/api/rentals', methods=['POST'])
@@ -398,54 +705,181 @@ def rent_film():
     if not customer_id or not film_id:
         return jsonify({"error": "Customer ID and Film ID are required"}), 400
     
-    conn = get_conn()
-    cur = conn.cursor()
-    
+    with get_conn() as conn:
+        cur = conn.cursor()
+
+        try:
+            cur.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (customer_id,))
+            if not cur.fetchone():
+                return jsonify({"error": "Customer not found"}), 404
+
+            cur.execute("""
+                SELECT f.film_id,
+                       (SELECT SUM(available_copies) FROM film_availability fa WHERE fa.film_id = f.film_id) AS available_copies
+                FROM film f
+                WHERE f.film_id = %s
+            """, (film_id,))
+            film = cur.fetchone()
+            if not film:
+                return jsonify({"error": "Film not found"}), 404
+
+            # fast path: the maintained counter says every copy is out (NULL means not backfilled yet)
+            if film['available_copies'] is not None and film['available_copies'] <= 0:
+                return jsonify({"error": "No copies of this film are currently available"}), 400
+
+            # row-locks the copy until commit, see inventory.allocate
+            inventory_id = inventory.allocate(cur, film_id)
+            if inventory_id is None:
+                conn.rollback()
+                return jsonify({"error": "No copies of this film are currently available"}), 400
+
+            cur.execute("""
+                INSERT INTO rental (inventory_id, customer_id, rental_date, staff_id)
+                VALUES (%s, %s, NOW(), 1)
+            """, (inventory_id, customer_id))
+
+            rental_id = cur.lastrowid
+            rollup.record_rental(cur, film_id, customer_id)
+            inventory.record_checkout(cur, inventory_id)
+            conn.commit()
+            cache.invalidate(cache.TOP_FILMS, cache.TOP_ACTORS, cache.film_key(film_id))
+
+            return jsonify({
+                "message": "Film rented successfully",
+                "rental_id": rental_id,
+                "customer_id": customer_id,
+                "film_id": film_id
+            }), 201
+
+        except Exception as e:
+            conn.rollback()
+            return jsonify({"error": "Failed to rent film"}), 500
+        finally:
+            cur.close()
+
+
+MAX_BATCH_RENTALS = 50
+
+#Feature 13b: Rent a basket of films in one transaction
+@app.route('/api/rentals/batch', methods=['POST'])
+def rent_films():
+    data = request.get_json()
+    customer_id = data.get('customer_id')
+    film_ids = data.get('film_ids') or []
+
+    if not customer_id or not isinstance(film_ids, list) or not film_ids:
+        return jsonify({"error": "Customer ID and a list of Film IDs are required"}), 400
+    if len(film_ids) > MAX_BATCH_RENTALS:
+        return jsonify({"error": f"At most {MAX_BATCH_RENTALS} films per checkout"}), 400
     try:
+        film_ids = [int(film_id) for film_id in film_ids]
+    except (TypeError, ValueError):
+        return jsonify({"error": "Film IDs must be integers"}), 400
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+
+        try:
+            cur.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (customer_id,))
+            if not cur.fetchone():
+                return jsonify({"error": "Customer not found"}), 404
+
+            distinct_ids = list(dict.fromkeys(film_ids))
+            cur.execute("""
+                SELECT f.film_id,
+                       (SELECT SUM(available_copies) FROM film_availability fa WHERE fa.film_id = f.film_id) AS available_copies
+                FROM film f
+                WHERE f.film_id IN ({})
+            """.format(", ".join(["%s"] * len(distinct_ids))), distinct_ids)
+            films = {row['film_id']: row['available_copies'] for row in cur.fetchall()}
+
+            # one entry per requested film, in request order; copies are
+            # locked in film_id order so overlapping baskets cannot deadlock
+            results = [None] * len(film_ids)
+            held = []  # inventory ids locked by this transaction
+            for position in sorted(range(len(film_ids)), key=lambda i: film_ids[i]):
+                film_id = film_ids[position]
+                if film_id not in films:
+                    results[position] = {"film_id": film_id, "status": "failed", "error": "Film not found"}
+                    continue
+                inventory_id = None
+                if films[film_id] is None or films[film_id] > 0:
+                    inventory_id = inventory.allocate(cur, film_id, exclude=held)
+                if inventory_id is None:
+                    results[position] = {"film_id": film_id, "status": "failed",
+                                         "error": "No copies of this film are currently available"}
+                    continue
+                held.append(inventory_id)
+                results[position] = {"film_id": film_id, "status": "rented", "inventory_id": inventory_id}
+
+            rented = [r for r in results if r["status"] == "rented"]
+            if not rented:
+                conn.rollback()
+                return jsonify({"customer_id": customer_id, "results": results}), 400
+
+            cur.execute(
+                "INSERT INTO rental (inventory_id, customer_id, rental_date, staff_id) VALUES "
+                + ", ".join(["(%s, %s, NOW(), 1)"] * len(rented)),
+                [value for r in rented for value in (r["inventory_id"], customer_id)],
+            )
+            # our copies are row-locked, so the open rentals on them are exactly the ones just inserted
+            cur.execute("""
+                SELECT rental_id, inventory_id FROM rental
+                WHERE rental_id >= %s AND customer_id = %s AND return_date IS NULL AND inventory_id IN ({})
+            """.format(", ".join(["%s"] * len(held))), [cur.lastrowid, customer_id] + held)
+            rental_ids = {row['inventory_id']: row['rental_id'] for row in cur.fetchall()}
+
+            per_film = {}
+            for r in rented:
+                r["rental_id"] = rental_ids[r["inventory_id"]]
+                per_film[r["film_id"]] = per_film.get(r["film_id"], 0) + 1
+            # same order as rent_film: rollups, then availability
+            rollup.record_rentals(cur, customer_id, per_film)
+            inventory.record_checkouts(cur, held)
+            conn.commit()
+            cache.invalidate(cache.TOP_FILMS, cache.TOP_ACTORS, *[cache.film_key(f) for f in per_film])
+
+            return jsonify({"customer_id": customer_id, "results": results}), 201
+
+        except Exception:
+            conn.rollback()
+            return jsonify({"error": "Failed to rent films"}), 500
+        finally:
+            cur.close()
+
+
+#Feature 14: Streaming exports, ?format=csv|ndjson&gzip=1, see export.py
+def export_response(sql, params, filename):
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    use_gzip = request.args.get('gzip') in ('1', 'true')
+    return export.stream_query(sql, params, fmt, use_gzip, filename)
+
+
+@app.route('/api/export/customers', methods=['GET'])
+def export_customers():
+    return export_response(export.CUSTOMERS_SQL, None, "customers")
+
+
+@app.route('/api/export/rentals', methods=['GET'])
+def export_rentals():
+    return export_response(export.RENTALS_SQL, None, "rentals")
+
+
+@app.route('/api/export/customers/<int:customer_id>/rentals', methods=['GET'])
+def export_customer_rentals(customer_id):
+    with get_conn(read_only=True) as conn:
+        cur = conn.cursor()
         cur.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (customer_id,))
-        if not cur.fetchone():
-            return jsonify({"error": "Customer not found"}), 404
-        
-        cur.execute("SELECT film_id FROM film WHERE film_id = %s", (film_id,))
-        if not cur.fetchone():
-            return jsonify({"error": "Film not found"}), 404
-        
-        cur.execute("""
-            SELECT i.inventory_id 
-            FROM inventory i 
-            LEFT JOIN rental r ON i.inventory_id = r.inventory_id AND r.return_date IS NULL
-            WHERE i.film_id = %s AND r.rental_id IS NULL
-            LIMIT 1
-        """, (film_id,))
-        
-        available_inventory = cur.fetchone()
-        if not available_inventory:
-            return jsonify({"error": "No copies of this film are currently available"}), 400
-        
-        inventory_id = available_inventory['inventory_id']
-        
-        cur.execute("""
-            INSERT INTO rental (inventory_id, customer_id, rental_date, staff_id)
-            VALUES (%s, %s, NOW(), 1)
-        """, (inventory_id, customer_id))
-        
-        rental_id = cur.lastrowid
-        conn.commit()
-        
-        return jsonify({
-            "message": "Film rented successfully",
-            "rental_id": rental_id,
-            "customer_id": customer_id,
-            "film_id": film_id
-        }), 201
-        
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": "Failed to rent film"}), 500
-    finally:
+        customer = cur.fetchone()
         cur.close()
-        conn.close()
-
+    if not customer:
+        return jsonify({"error": "Customer not found"}), 404
+    return export_response(export.CUSTOMER_RENTALS_SQL, (customer_id,), f"customer-{customer_id}-rentals")
 
 if __name__ == '__main__':
+    rollup.ensure()  # before the index check, which skips tables that do not exist yet
+    indexes.ensure()
+    search.reload()
     app.run(debug=True, port=5000)
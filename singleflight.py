@@ -0,0 +1,88 @@
+import contextlib
+import hashlib
+import os
+import threading
+
+try:
+    import fcntl  # POSIX only; without it coalescing stays within one process
+except ImportError:
+    fcntl = None
+
+SINGLEFLIGHT_LOCK_DIR = os.getenv("SINGLEFLIGHT_LOCK_DIR")  # set to share leadership across workers
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Concurrent do(key, fn) calls share one execution of fn: the first caller
+    # runs it, the rest wait and get the same result (or exception).
+    def __init__(self, lock_dir=SINGLEFLIGHT_LOCK_DIR):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    @property
+    def cross_process(self):
+        return bool(self.lock_dir)
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self._process_lock(key):
+                call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    @contextlib.contextmanager
+    def _process_lock(self, key):
+        # one leader per key across every worker that shares lock_dir
+        if not self.lock_dir:
+            yield
+            return
+        path = os.path.join(self.lock_dir, hashlib.sha1(key.encode()).hexdigest() + ".lock")
+        with open(path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+                "cross_process": self.cross_process,
+            }
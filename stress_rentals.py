@@ -0,0 +1,141 @@
+import argparse
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db import get_conn
+from loadtest import HttpClient, InProcessClient, percentile
+
+# Concurrency check for POST /api/rentals.
+#
+#   race:       every client checks out the same film at the same instant; exactly
+#               min(free copies, clients) may succeed and no copy may end up with
+#               two open rentals.
+#   throughput: clients rent and return random films for --duration seconds and
+#               report checkouts/sec and latency percentiles.
+#
+# Exits 1 if the race phase finds a double allocation.
+
+
+def free_copies(film_id):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT COUNT(*) AS free
+            FROM inventory i
+            WHERE i.film_id = %s
+              AND NOT EXISTS (SELECT 1 FROM rental r WHERE r.inventory_id = i.inventory_id AND r.return_date IS NULL)
+        """, (film_id,))
+        free = cur.fetchone()["free"]
+        cur.close()
+    return free
+
+
+def double_allocations(film_id):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT r.inventory_id, COUNT(*) AS open_rentals
+            FROM rental r
+            JOIN inventory i ON r.inventory_id = i.inventory_id
+            WHERE i.film_id = %s AND r.return_date IS NULL
+            GROUP BY r.inventory_id
+            HAVING COUNT(*) > 1
+        """, (film_id,))
+        rows = cur.fetchall()
+        cur.close()
+    return rows
+
+
+def race(client, film_id, clients, rounds, customers):
+    ok = True
+    for n in range(1, rounds + 1):
+        free = free_copies(film_id)
+        barrier = threading.Barrier(clients)
+
+        def checkout(_):
+            barrier.wait()
+            return client.call_json("POST", "/api/rentals",
+                               {"customer_id": random.randint(1, customers), "film_id": film_id})
+
+        with ThreadPoolExecutor(clients) as pool:
+            results = list(pool.map(checkout, range(clients)))
+
+        rented = [body["rental_id"] for status, body in results if status == 201]
+        errors = [status for status, _ in results if status not in (201, 400)]
+        doubles = double_allocations(film_id)
+        expected = min(free, clients)
+        passed = len(rented) == expected and not doubles and not errors
+        ok = ok and passed
+        print(f"race round {n}: {clients} clients, {free} free copies, {len(rented)} rented "
+              f"(expected {expected}), {len(errors)} errors, {len(doubles)} double-allocated copies"
+              f" -> {'ok' if passed else 'FAIL'}")
+
+        for rental_id in rented:
+            client.call("PUT", f"/api/rentals/{rental_id}/return")
+    return ok
+
+
+def throughput(client, clients, duration, films, customers):
+    deadline = time.monotonic() + duration
+    latencies = []
+    counts = {"rented": 0, "unavailable": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def worker(_):
+        local_latencies = []
+        local = {"rented": 0, "unavailable": 0, "errors": 0}
+        while time.monotonic() < deadline:
+            body = {"customer_id": random.randint(1, customers), "film_id": random.randint(1, films)}
+            start = time.perf_counter()
+            status, resp = client.call_json("POST", "/api/rentals", body)
+            local_latencies.append(time.perf_counter() - start)
+            if status == 201:
+                local["rented"] += 1
+                client.call("PUT", f"/api/rentals/{resp['rental_id']}/return")
+            elif status == 400:
+                local["unavailable"] += 1
+            else:
+                local["errors"] += 1
+        with lock:
+            latencies.extend(local_latencies)
+            for key, value in local.items():
+                counts[key] += value
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(worker, range(clients)))
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    print(f"throughput: {clients} clients for {elapsed:.1f}s, {counts['rented']} checkouts "
+          f"({counts['rented'] / elapsed:.1f}/s), {counts['unavailable']} unavailable, {counts['errors']} errors")
+    print(f"checkout latency ms: p50={ms(percentile(latencies, 50))} "
+          f"p95={ms(percentile(latencies, 95))} p99={ms(percentile(latencies, 99))}")
+    return counts["errors"] == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress POST /api/rentals with concurrent clients")
+    parser.add_argument("--url", default="http://localhost:5000", help="server to drive (ignored with --in-process)")
+    parser.add_argument("--in-process", action="store_true", help="call the Flask app directly instead of over HTTP")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--film-id", type=int, default=1, help="film every client fights over in the race phase")
+    parser.add_argument("--rounds", type=int, default=5, help="race rounds")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of the throughput phase, 0 skips it")
+    parser.add_argument("--films", type=int, default=1000, help="throughput phase rents film ids 1..N")
+    parser.add_argument("--customers", type=int, default=599, help="clients rent as customer ids 1..N")
+    args = parser.parse_args()
+
+    client = InProcessClient() if args.in_process else HttpClient(args.url)
+    ok = race(client, args.film_id, args.clients, args.rounds, args.customers)
+    if args.duration:
+        ok = throughput(client, args.clients, args.duration, args.films, args.customers) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
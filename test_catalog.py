@@ -0,0 +1,86 @@
+import threading
+import time
+
+import catalog
+import search
+
+
+class Snap:
+    # stand-in for catalog.Snapshot: only loaded_at matters to search
+    def __init__(self, loaded_at):
+        self.loaded_at = loaded_at
+
+
+def wait_for_refresh(refresher, timeout=5):
+    deadline = time.monotonic() + timeout
+    while refresher._refreshing:
+        assert time.monotonic() < deadline, "background refresh did not finish"
+        time.sleep(0.001)
+
+
+def test_refresher_loads_inline_then_swaps_in_background():
+    values = iter(["first", "second"])
+    gate = threading.Event()
+    gate.set()
+    stale = {"now": False}
+
+    def load():
+        gate.wait(5)
+        return next(values)
+
+    refresher = catalog.Refresher(load, lambda value: stale["now"])
+    assert refresher.get() == "first"
+    assert refresher.get() == "first"
+
+    gate.clear()
+    stale["now"] = True
+    assert refresher.get() == "first"  # readers keep the old value while it rebuilds
+    assert refresher.get() == "first"  # and only one rebuild is started
+    gate.set()
+    wait_for_refresh(refresher)
+    stale["now"] = False
+    assert refresher.get() == "second"
+
+
+def test_failed_refresh_keeps_serving_and_retries():
+    calls = []
+
+    def load():
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("database down")
+        return len(calls)
+
+    stale = {"now": False}
+    refresher = catalog.Refresher(load, lambda value: stale["now"])
+    assert refresher.get() == 1
+    stale["now"] = True
+    refresher.get()
+    wait_for_refresh(refresher)
+    assert refresher.value == 1
+    refresher.get()
+    wait_for_refresh(refresher)
+    assert refresher.value == 3
+
+
+def test_search_indexes_follow_the_catalog_snapshot(monkeypatch):
+    current = {"snapshot": Snap(1.0)}
+    builds = []
+
+    def build():
+        snapshot = current["snapshot"]
+        builds.append(snapshot.loaded_at)
+        return search.Indexes(snapshot.loaded_at, f"index@{snapshot.loaded_at}", None)
+
+    monkeypatch.setattr(catalog, "get", lambda: current["snapshot"])
+    monkeypatch.setattr(search, "_indexes", catalog.Refresher(build, search._outdated))
+
+    assert search.get_index() == "index@1.0"
+    assert search.get_index() == "index@1.0"
+    assert builds == [1.0]  # no timer of its own: an unchanged snapshot is not re-indexed
+
+    current["snapshot"] = Snap(2.0)
+    search.get_index()
+    wait_for_refresh(search._indexes)
+    assert search.get_index() == "index@2.0"
+    assert builds == [1.0, 2.0]
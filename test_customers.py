@@ -0,0 +1,87 @@
+import base64
+
+import pytest
+
+import db
+import export
+import metrics
+import server
+
+
+def token(raw):
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trips():
+    assert server.decode_cursor(server.encode_cursor(599)) == 599
+
+
+@pytest.mark.parametrize("raw", ["c²", "c١٢", "c 12", "c+12", "c1_000", "c", "x12"])
+def test_cursor_accepts_only_ascii_digits(raw):
+    assert server.decode_cursor(token(raw)) is None
+
+
+@pytest.mark.parametrize("after", [token("c²"), "é", "_w"])  # "_w" decodes to b"\xff"
+def test_bad_cursor_is_a_400(after):
+    resp = server.app.test_client().get("/api/customers", query_string={"after": after})
+    assert resp.status_code == 400
+    assert resp.get_json() == {"error": "Invalid cursor"}
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.rowcount = len(rows)
+
+    def execute(self, sql, args=None):
+        pass
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    # each cursor() gets the next result set
+    def __init__(self, *results):
+        self.results = list(results)
+
+    def cursor(self, cursorclass=None):
+        return db.observe_cursor(FakeCursor(self.results.pop(0)))
+
+    def close(self):
+        pass
+
+
+def record_labels(monkeypatch, labels):
+    monkeypatch.setattr(db, "query_observers", [lambda label, sql, params, seconds, rows: labels.append(label)])
+    monkeypatch.setattr(db, "label_provider", metrics._query_label)
+
+
+def test_streamed_history_is_attributed_to_the_endpoint(monkeypatch):
+    history = [{"rental_id": n, "rental_rate": 2.99, "days_rented": 3, "return_date": None} for n in range(1200)]
+    labels = []
+    record_labels(monkeypatch, labels)
+    monkeypatch.setattr(server, "get_conn", lambda read_only=False: FakeConn([{"customer_id": 1, "first_name": "Ann"}], history))
+
+    resp = server.app.test_client().get("/api/customers/1/details?stream=1")
+    body = resp.get_json()
+    assert [r["rental_id"] for r in body["rentals"]] == list(range(1200))
+    assert body["statistics"]["total_rentals"] == 1200
+    assert labels == ["get_customer_details", "get_customer_details"]
+
+
+def test_export_query_is_attributed_to_the_endpoint(monkeypatch):
+    labels = []
+    record_labels(monkeypatch, labels)
+    monkeypatch.setattr(export, "get_conn", lambda read_only=False: FakeConn([{"customer_id": 1}, {"customer_id": 2}]))
+
+    resp = server.app.test_client().get("/api/export/customers?format=ndjson")
+    assert resp.get_data(as_text=True) == '{"customer_id":1}\n{"customer_id":2}\n'
+    assert labels == ["export_customers"]
@@ -0,0 +1,84 @@
+import pytest
+
+import server
+from import_customers import Importer, validate
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, sql, args=None):
+        # store and address lookups: every id exists
+        self.rows = [{"id": i} for i in args or ()]
+
+    def executemany(self, sql, rows):
+        self.conn.inserted.extend(rows)
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self):
+        self.inserted = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+@pytest.mark.parametrize("row, message", [
+    ({"first_name": 5, "last_name": "x"}, "first_name must be a string"),
+    ({"first_name": "a", "last_name": ["x"]}, "last_name must be a string"),
+    ({"first_name": "a", "last_name": "x", "email": {"at": "b"}}, "email must be a string"),
+    ({"first_name": "a", "last_name": "x", "email": 0}, "email must be a string"),
+])
+def test_validate_rejects_non_string_fields(row, message):
+    with pytest.raises(ValueError, match=message):
+        validate(row)
+
+
+def test_mixed_type_rows_are_reported_per_row():
+    conn = FakeConn()
+    rows = [
+        {"first_name": "Ann", "last_name": "Lee", "email": "ann@example.org"},
+        {"first_name": 5, "last_name": "x"},
+        {"first_name": "Bo", "last_name": "Kim", "email": 7},
+        {"first_name": "Cy", "last_name": "Orr", "store_id": {"id": 1}},
+        {"first_name": "Di", "last_name": "Poe"},
+    ]
+    report = Importer(conn, chunk_size=2).run(rows)
+    assert report["inserted"] == 2
+    assert [e["row"] for e in report["errors"]] == [2, 3, 4]
+    assert [r[1] for r in conn.inserted] == ["Ann", "Di"]
+
+
+@pytest.mark.parametrize("active, expected", [
+    (None, 1), ("", 1), (" ", 1), (True, 1), (False, 0), (1, 1), (0, 0),
+    ("1", 1), ("0", 0), ("TRUE", 1), ("false", 0), ("yes", 1), ("No", 0),
+])
+def test_active_flag_spellings(active, expected):
+    row = {"first_name": "Ann", "last_name": "Lee", "active": active}
+    assert validate(row)[-1] == expected
+
+
+@pytest.mark.parametrize("active", ["maybe", "2", 2, -1, [1]])
+def test_unrecognised_active_is_a_row_error(active):
+    with pytest.raises(ValueError, match="active must be"):
+        validate({"first_name": "Ann", "last_name": "Lee", "active": active})
+
+
+def test_non_integer_chunk_size_is_a_400():
+    resp = server.app.test_client().post("/api/customers/bulk?chunk_size=abc", json=[])
+    assert resp.status_code == 400
+    assert resp.get_json() == {"error": "chunk_size must be an integer"}
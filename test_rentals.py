@@ -0,0 +1,120 @@
+import pytest
+
+import server
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+        self.lastrowid = 500
+        self.rowcount = 1
+
+    def execute(self, sql, args=None):
+        sql = " ".join(sql.split())
+        args = list(args or ())
+        self.conn.executed.append((sql, args))
+        self.rows = self.conn.respond(sql, args)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    # answers the statements the rental handlers run; copy n of film f is
+    # inventory_id f * 10 + n, every copy in store 1
+    def __init__(self):
+        self.executed = []
+        self.allocated = []  # film_ids in the order copies were locked
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def respond(self, sql, args):
+        if sql.startswith("SELECT customer_id FROM customer"):
+            return [{"customer_id": args[0]}]
+        if "FROM film f WHERE f.film_id" in sql:
+            return [{"film_id": film_id, "available_copies": 5} for film_id in args]
+        if "SKIP LOCKED" in sql:
+            film_id, held = args[0], args[1:]
+            self.allocated.append(film_id)
+            return [{"inventory_id": film_id * 10 + sum(1 for i in held if i // 10 == film_id)}]
+        if sql.startswith("SELECT rental_id, inventory_id"):
+            return [{"rental_id": 1000 + i, "inventory_id": i} for i in args[2:]]
+        if "-COUNT(*) AS delta" in sql:
+            # what GROUP BY ... ORDER BY film_id, store_id returns
+            films = sorted({i // 10 for i in args})
+            return [{"film_id": f, "store_id": 1, "delta": -sum(1 for i in args if i // 10 == f)} for f in films]
+        return []
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def index(self, prefix):
+        return next(n for n, (sql, _) in enumerate(self.executed) if sql.startswith(prefix))
+
+    def statements(self, prefix):
+        return [(sql, args) for sql, args in self.executed if sql.startswith(prefix)]
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    conn = FakeConn()
+    monkeypatch.setattr(server, "get_conn", lambda read_only=False: conn)
+    return conn
+
+
+def test_basket_locks_in_film_order_and_answers_in_request_order(conn):
+    resp = server.app.test_client().post("/api/rentals/batch", json={"customer_id": 1, "film_ids": [7, 3, 5, 3]})
+    assert resp.status_code == 201
+    assert [(r["film_id"], r["inventory_id"]) for r in resp.get_json()["results"]] == [(7, 70), (3, 30), (5, 50), (3, 31)]
+    assert conn.allocated == [3, 3, 5, 7]
+
+
+def test_basket_updates_rollups_then_availability_in_key_order(conn):
+    server.app.test_client().post("/api/rentals/batch", json={"customer_id": 1, "film_ids": [7, 3, 5, 3]})
+
+    (films_sql, films_args), = conn.statements("INSERT INTO film_rental_count")
+    assert films_args == [3, 2, 5, 1, 7, 1]
+    (actors_sql, actors_args), = conn.statements("INSERT INTO actor_rental_count")
+    assert "ORDER BY actor_id" in actors_sql and actors_args[-3:] == [3, 5, 7]
+    updates = conn.statements("UPDATE film_availability")
+    assert [(args[1], args[2]) for _, args in updates] == [(3, 1), (5, 1), (7, 1)]
+    assert "ORDER BY film_id, store_id" in conn.statements("SELECT film_id, store_id, -COUNT(*)")[0][0]
+
+    assert (conn.index("INSERT INTO film_rental_count")
+            < conn.index("INSERT INTO actor_rental_count")
+            < conn.index("INSERT INTO customer_rental_summary")
+            < conn.index("UPDATE film_availability"))
+
+
+def test_single_checkout_uses_the_same_order(conn):
+    resp = server.app.test_client().post("/api/rentals", json={"customer_id": 1, "film_id": 4})
+    assert resp.status_code == 201
+    assert (conn.index("INSERT INTO film_rental_count")
+            < conn.index("INSERT INTO actor_rental_count")
+            < conn.index("INSERT INTO customer_rental_summary")
+            < conn.index("UPDATE film_availability"))
+
+
+@pytest.mark.parametrize("body", [[1, 2], "1", 5, {"rental_ids": [True]}, {"rental_ids": [1, False]}])
+def test_batch_return_rejects_malformed_bodies(conn, body):
+    resp = server.app.test_client().put("/api/rentals/return", json=body)
+    assert resp.status_code == 400
+    assert resp.is_json
+    assert not conn.executed
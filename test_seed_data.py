@@ -0,0 +1,93 @@
+import pymysql
+import pytest
+
+import seed_data
+
+SMALLINT = {"data_type": "smallint", "column_type": "smallint unsigned"}
+MEDIUMINT = {"data_type": "mediumint", "column_type": "mediumint unsigned"}
+
+# stock Sakila key types
+COLUMNS = {
+    ("customer", "customer_id"): SMALLINT,
+    ("rental", "customer_id"): SMALLINT,
+    ("payment", "customer_id"): SMALLINT,
+    ("inventory", "inventory_id"): MEDIUMINT,
+    ("rental", "inventory_id"): MEDIUMINT,
+}
+BASE = {"customers": 599, "max_customer_id": 599, "inventory": 4581, "max_inventory_id": 4581}
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, sql, args=None):
+        sql = " ".join(sql.split())
+        self.conn.executed.append(sql)
+        if sql in self.conn.fail:
+            raise pymysql.err.OperationalError(1142, "TRIGGER command denied")
+        if "information_schema.COLUMNS" in sql:
+            self.rows = [COLUMNS[args]] if args in COLUMNS else []
+        elif "information_schema.TRIGGERS" in sql:
+            self.rows = [{"TRIGGER_NAME": "customer_create_date", "EVENT_OBJECT_TABLE": "customer"},
+                         {"TRIGGER_NAME": "rental_date", "EVENT_OBJECT_TABLE": "rental"}]
+        elif sql.startswith("SHOW CREATE TRIGGER"):
+            name = sql.split("`")[1]
+            self.rows = [{"SQL Original Statement": f"CREATE DEFINER=`root`@`localhost` TRIGGER `{name}` "
+                                                    "BEFORE INSERT ON t FOR EACH ROW SET NEW.d = NOW()"}]
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, fail=()):
+        self.executed = []
+        self.fail = set(fail)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def extra(scale):
+    return {key: BASE[key] * (scale - 1) for key in ("customers", "inventory")}
+
+
+def test_scale_that_fits_passes():
+    seed_data.check_id_ranges(FakeConn().cursor(), BASE, extra(100))
+
+
+def test_scale_that_overflows_smallint_is_refused():
+    with pytest.raises(SystemExit, match="customer.customer_id holds at most 65535"):
+        seed_data.check_id_ranges(FakeConn().cursor(), BASE, extra(1000))
+
+
+def test_triggers_are_restored_after_a_failed_load():
+    conn = FakeConn()
+    with pytest.raises(RuntimeError):
+        with seed_data.suspended_triggers(conn, seed_data.DATE_TRIGGERS, log=lambda msg: None):
+            conn.executed.append("LOAD")
+            raise RuntimeError("load failed")
+    after = conn.executed[conn.executed.index("LOAD") + 1:]
+    # recreated without the DEFINER clause, so the current user owns them
+    assert after == [
+        "CREATE TRIGGER `customer_create_date` BEFORE INSERT ON t FOR EACH ROW SET NEW.d = NOW()",
+        "CREATE TRIGGER `rental_date` BEFORE INSERT ON t FOR EACH ROW SET NEW.d = NOW()",
+    ]
+    assert conn.executed.index("DROP TRIGGER `rental_date`") < conn.executed.index("LOAD")
+
+
+def test_missing_privilege_stops_before_anything_is_dropped():
+    probe = "CREATE TRIGGER seed_data_probe BEFORE INSERT ON rental FOR EACH ROW SET @seed_data_probe = 1"
+    conn = FakeConn(fail=[probe])
+    with pytest.raises(SystemExit, match="needs to drop and recreate triggers on rental"):
+        with seed_data.suspended_triggers(conn, seed_data.DATE_TRIGGERS, log=lambda msg: None):
+            pytest.fail("the load must not start")
+    assert not any(sql.startswith("DROP TRIGGER `") for sql in conn.executed)
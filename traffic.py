@@ -0,0 +1,112 @@
+import io
+import json
+import os
+import random
+import threading
+import time
+
+from flask import g, request
+
+# Records live traffic as NDJSON for replay.py: one line per request with
+# method, path, query string, body, status and latency. Off unless
+# TRAFFIC_RECORD names a file (requests.jsonl is already in .gitignore).
+
+TRAFFIC_RECORD = os.getenv("TRAFFIC_RECORD")
+TRAFFIC_SAMPLE = float(os.getenv("TRAFFIC_SAMPLE", 1))  # share of requests to record
+TRAFFIC_MAX_BODY = int(os.getenv("TRAFFIC_MAX_BODY", 65536))  # larger bodies are recorded truncated
+SKIP_PATHS = ("/metrics",)
+
+
+class RecordingStream(io.RawIOBase):
+    # stands in for request.stream and keeps the first max_body bytes of
+    # whatever the handler reads, so routes that stream the body (bulk
+    # import) are recorded as well as those that call get_data()
+    def __init__(self, raw, max_body):
+        self._raw = raw
+        self.max_body = max_body
+        self.captured = bytearray()
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._raw.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self._keep(data)
+        return n
+
+    def _keep(self, data):
+        self.size += len(data)
+        room = self.max_body - len(self.captured)
+        if room > 0:
+            self.captured += data[:room]
+
+    def drain(self):
+        # the part of the body the handler never read
+        while True:
+            data = self._raw.read(65536)
+            if not data:
+                return
+            self._keep(data)
+
+
+class TrafficRecorder:
+    def __init__(self, path, sample=1.0, max_body=65536):
+        self.path = path
+        self.sample = sample
+        self.max_body = max_body
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)  # line buffered, one request per line
+
+    def before(self):
+        if request.path in SKIP_PATHS or (self.sample < 1 and random.random() >= self.sample):
+            return
+        g.traffic_start = (time.time(), time.perf_counter())
+        stream = RecordingStream(request.stream, self.max_body)
+        request._get_current_object().stream = stream  # handlers and get_data() read through it
+        g.traffic_body = stream
+
+    def after(self, response):
+        start = g.pop("traffic_start", None)
+        if start is None:
+            return response
+        stream = g.pop("traffic_body")
+        stream.drain()
+        body = bytes(stream.captured)
+        entry = {
+            "ts": round(start[0], 6),
+            "method": request.method,
+            "path": request.path,
+            "query": request.query_string.decode("latin-1"),
+            "content_type": request.content_type,
+            "body": body.decode("utf-8", "replace") if body else None,
+            "truncated": stream.size > self.max_body,
+            "status": response.status_code,
+            # streamed responses: time until the body starts, not until it ends
+            "latency_ms": round((time.perf_counter() - start[1]) * 1000, 3),
+            "bytes": None if response.is_streamed else response.content_length,
+        }
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self.recorded += 1
+        return response
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+recorder = None
+
+
+def init_app(app):
+    global recorder
+    if not TRAFFIC_RECORD:
+        return
+    recorder = TrafficRecorder(TRAFFIC_RECORD, TRAFFIC_SAMPLE, TRAFFIC_MAX_BODY)
+    app.before_request(recorder.before)
+    app.after_request(recorder.after)